@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import json
+import time
+from utilita.api import EXECUTOR_DECODE_THRESHOLD
+from benchmarks.fake_portal import FIXTURES, JSON_PATHS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _decoders():
+    decoders = {"json": json.loads}
+    if orjson is not None:
+        decoders["orjson"] = orjson.loads
+    return decoders
+
+
+def _body(key, scale):
+    """Return the fixture encoded as the portal sends it, with usage rows repeated `scale` times."""
+    payload = json.loads((FIXTURES / f"{key}.json").read_text())
+    if key == "usage":
+        for supply in payload["data"]["data"]:
+            supply["usage"] = supply["usage"] * scale
+    return json.dumps(payload).encode()
+
+
+async def _async_time(decoder, body, loops, executor):
+    """Return the mean wall time of one decode in microseconds, and the time the event loop was blocked."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    blocked = 0.0
+    for _ in range(loops):
+        if executor:
+            await loop.run_in_executor(None, decoder, body)
+        else:
+            started = time.perf_counter()
+            decoder(body)
+            blocked += time.perf_counter() - started
+    return (time.perf_counter() - start) / loops * 1e6, blocked / loops * 1e6
+
+
+async def async_run(args):
+    rows = []
+    for key in JSON_PATHS.values():
+        body = _body(key, args.scale)
+        for name, decoder in _decoders().items():
+            for executor in (False, True):
+                wall, blocked = await _async_time(decoder, body, args.loops, executor)
+                rows.append((key, len(body), name, "executor" if executor else "loop", wall, blocked))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON decoders on the recorded Utilita fixtures.")
+    parser.add_argument("--loops", type=int, default=500, help="decodes per measurement")
+    parser.add_argument("--scale", type=int, default=1, help="repeat the usage rows to simulate longer histories")
+    args = parser.parse_args()
+
+    print(f"Bodies of {EXECUTOR_DECODE_THRESHOLD} bytes or more are decoded in an executor by default.\n")
+    print(f"{'payload':<11}{'bytes':>9}  {'decoder':<8}{'where':<10}{'wall us':>10}{'loop blocked us':>17}")
+    for key, size, name, where, wall, blocked in asyncio.run(async_run(args)):
+        print(f"{key:<11}{size:>9}  {name:<8}{where:<10}{wall:>10.1f}{blocked:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.components.sensor import SensorEntity
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+from utilita import sensor
+from utilita.api import ENDPOINTS, EXECUTOR_DECODE_THRESHOLD, JSON_DECODER, UtilitaClient
+from utilita.const import CONF_EMAIL, CONF_PASSWORD, CONF_REFRESH_RATE, DEFAULT_REFRESH_RATE, DOMAIN
+from utilita.coordinator import UtilitaCoordinator
+from utilita.scheduler import UtilitaScheduler
+from benchmarks.fake_portal import FakePortal
+
+PROPERTIES = ("extra_state_attributes", "available")
+
+
+class UnthrottledScheduler(UtilitaScheduler):
+    """Scheduler without the refresh stagger and request budget, which would otherwise dominate the timings."""
+
+    async def async_wait_turn(self):
+        return
+
+    async def _async_take_token(self):
+        return
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def _summary(name, portal, timings, cycles):
+    return {
+        "scenario": name,
+        "cycles": cycles,
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": _percentile(timings, 95) * 1000,
+        "requests_per_cycle": sum(portal.requests.values()) / cycles,
+        "bytes_per_cycle": sum(portal.bytes_sent.values()) / cycles,
+        "logins": portal.logins,
+    }
+
+
+async def _async_cycles(coordinator, portal, name, cycles, before=None):
+    """Refresh every endpoint `cycles` times and return the timings and traffic."""
+    portal.reset_counters()
+    timings = []
+    for cycle in range(cycles):
+        if before is not None:
+            before(cycle)
+        coordinator.request_endpoints(ENDPOINTS)
+        start = time.perf_counter()
+        await coordinator.async_refresh()
+        timings.append(time.perf_counter() - start)
+        if not coordinator.last_update_success:
+            raise RuntimeError(f"Refresh failed during the {name} scenario")
+    return _summary(name, portal, timings, cycles)
+
+
+def _bump_balance(portal, payload):
+    """Return a callback that changes the balance before each cycle, like a new meter reading."""
+    def before(cycle):
+        for supply in payload["data"]["supplies"]:
+            supply["balance"]["money"] += 1
+        portal.set_fixture("balance", payload)
+    return before
+
+
+def _value_property(entity):
+    """Return the property a sensor computes its value in; several override state rather than native_value."""
+    for cls in type(entity).__mro__:
+        if cls is SensorEntity:
+            break
+        for prop in ("state", "native_value"):
+            if prop in vars(cls):
+                return prop
+    return "native_value"
+
+
+async def _async_sensor_costs(hass, entry, coordinator, loops):
+    """Time each property of every sensor, in microseconds per evaluation."""
+    entities = []
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = {"coordinator": coordinator}
+    # Sensor setup prunes stale registry entries, so it needs the entity registry.
+    await er.async_load(hass)
+    await sensor.async_setup_entry(hass, entry, entities.extend)
+    costs = {}
+    for entity in entities:
+        for prop in (_value_property(entity),) + PROPERTIES:
+            seconds = timeit.timeit(lambda: getattr(entity, prop), number=loops)
+            costs[f"{entity.name} {prop}"] = seconds / loops * 1e6
+    return costs
+
+
+async def async_run(args):
+    portal = FakePortal(args.latency, args.failure_rate)
+    await portal.async_start()
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        entry = ConfigEntry(
+            version=1,
+            minor_version=1,
+            domain=DOMAIN,
+            title="Utilita Energy",
+            data={CONF_EMAIL: "bench@example.com", CONF_PASSWORD: "bench", CONF_REFRESH_RATE: DEFAULT_REFRESH_RATE},
+            source="user",
+        )
+        scheduler = UnthrottledScheduler()
+        client = UtilitaClient(
+            entry.data[CONF_EMAIL],
+            entry.data[CONF_PASSWORD],
+            scheduler,
+            base_url=portal.url,
+            decoder=json.loads if args.stdlib_json else JSON_DECODER,
+            executor_threshold=None if args.no_executor else EXECUTOR_DECODE_THRESHOLD,
+        )
+        coordinator = UtilitaCoordinator(hass, entry, client, scheduler)
+        await coordinator.async_load_storage()
+        try:
+            results = [await _async_cycles(coordinator, portal, "cold", 1)]
+            results.append(await _async_cycles(coordinator, portal, "unchanged", args.cycles))
+            bump_balance = _bump_balance(portal, portal.fixture("balance"))
+            results.append(await _async_cycles(coordinator, portal, "balance_changed", args.cycles, bump_balance))
+            results.append(
+                await _async_cycles(coordinator, portal, "session_expired", args.cycles, lambda cycle: portal.expire_sessions())
+            )
+
+            costs = await _async_sensor_costs(hass, entry, coordinator, args.loops)
+        finally:
+            await client.async_close()
+            await portal.async_stop()
+            await hass.async_stop(force=True)
+    return {"refresh": results, "sensor_us": costs}
+
+
+def _print_report(report):
+    print(f"{'scenario':<18}{'cycles':>7}{'p50 ms':>10}{'p95 ms':>10}{'req/cycle':>11}{'bytes/cycle':>13}{'logins':>8}")
+    for row in report["refresh"]:
+        print(
+            f"{row['scenario']:<18}{row['cycles']:>7}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            f"{row['requests_per_cycle']:>11.1f}{row['bytes_per_cycle']:>13.0f}{row['logins']:>8}"
+        )
+    print()
+    print(f"{'sensor property':<60}{'us/eval':>10}")
+    for name, cost in report["sensor_us"].items():
+        print(f"{name:<60}{cost:>10.2f}")
+
+
+def _regressions(report, baseline, tolerance):
+    """Compare against a previous --output report and describe anything that got worse."""
+    problems = []
+    previous = {row["scenario"]: row for row in baseline["refresh"]}
+    for row in report["refresh"]:
+        old = previous.get(row["scenario"])
+        if old is None:
+            continue
+        if row["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            problems.append(f"{row['scenario']}: p50 {old['p50_ms']:.2f} ms -> {row['p50_ms']:.2f} ms")
+        for field in ("requests_per_cycle", "bytes_per_cycle"):
+            if row[field] > old[field] * (1 + tolerance):
+                problems.append(f"{row['scenario']}: {field} {old[field]:.0f} -> {row[field]:.0f}")
+    for name, cost in report["sensor_us"].items():
+        old = baseline["sensor_us"].get(name)
+        if old is not None and cost > old * (1 + tolerance) and cost - old > 1:
+            problems.append(f"{name}: {old:.2f} us -> {cost:.2f} us")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Utilita refreshes against the offline fake portal.")
+    parser.add_argument("--cycles", type=int, default=20, help="refreshes per scenario")
+    parser.add_argument("--loops", type=int, default=2000, help="evaluations per sensor property")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake portal adds to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of JSON requests the fake portal fails")
+    parser.add_argument("--stdlib-json", action="store_true", help="decode with the json module even if orjson is installed")
+    parser.add_argument("--no-executor", action="store_true", help="decode every payload on the event loop")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--baseline", help="fail if worse than this earlier --output report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    report = asyncio.run(async_run(args))
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            problems = _regressions(report, json.load(file), args.tolerance)
+        if problems:
+            print("\nRegressions against the baseline:")
+            print("\n".join(problems))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import secrets
+from collections import Counter
+from pathlib import Path
+from aiohttp import web
+
+FIXTURES = Path(__file__).parent / "fixtures"
+SESSION_COOKIE = "utilita_session"
+JSON_PATHS = {
+    "/json/balance": "balance",
+    "/json/usage": "usage",
+    "/user-data": "user_data",
+    "/json/payments": "payments",
+}
+
+
+class FakePortal:
+    """Offline stand-in for my.utilita.co.uk serving the recorded fixtures.
+
+    latency (seconds) is added to every response. failure_rate is the share of
+    JSON requests answered with failure_status instead of the fixture. Requests
+    and bytes sent are counted per path for the benchmarks.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, failure_status=503, etags=True):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.etags = etags
+        self.requests = Counter()
+        self.bytes_sent = Counter()
+        self.logins = 0
+        self._login_page = (FIXTURES / "login.html").read_text()
+        self._fixtures = {key: json.loads((FIXTURES / f"{key}.json").read_text()) for key in JSON_PATHS.values()}
+        self._bodies = {}
+        self._tokens = set()
+        self._sessions = set()
+        self._runner = None
+        self.url = None
+
+    def fixture(self, key):
+        """Return a copy of the payload served for an endpoint."""
+        return json.loads(json.dumps(self._fixtures[key]))
+
+    def set_fixture(self, key, payload):
+        """Replace the payload served for an endpoint, e.g. to simulate new data."""
+        self._fixtures[key] = payload
+        self._bodies = {cache_key: body for cache_key, body in self._bodies.items() if cache_key[0] != key}
+
+    def expire_sessions(self):
+        """Forget every session, so the next JSON request is redirected to the login page."""
+        self._sessions.clear()
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.bytes_sent.clear()
+        self.logins = 0
+
+    def app(self):
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/login", self._login_page_handler)
+        app.router.add_post("/login", self._login_handler)
+        app.router.add_get("/energy", self._energy_handler)
+        for path, key in JSON_PATHS.items():
+            app.router.add_get(path, self._json_handler(key))
+        return app
+
+    async def async_start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        # aiohttp's cookie jar ignores cookies from bare IP addresses, so use a host name.
+        self.url = f"http://{'localhost' if host == '127.0.0.1' else host}:{port}"
+        return self.url
+
+    async def async_stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests[request.path] += 1
+        response = None
+        try:
+            response = await handler(request)
+            return response
+        except web.HTTPException as err:
+            # Redirects are raised rather than returned.
+            response = err
+            raise
+        finally:
+            if response is not None and response.body is not None:
+                self.bytes_sent[request.path] += len(response.body)
+
+    async def _login_page_handler(self, request):
+        token = secrets.token_hex(20)
+        self._tokens.add(token)
+        return web.Response(text=self._login_page.replace("{token}", token), content_type="text/html")
+
+    async def _login_handler(self, request):
+        form = await request.post()
+        if form.get("_token") not in self._tokens or not form.get("email") or not form.get("password"):
+            raise web.HTTPFound("/login")
+        self._tokens.discard(form["_token"])
+        session = secrets.token_hex(20)
+        self._sessions.add(session)
+        self.logins += 1
+        response = web.HTTPFound("/energy")
+        response.set_cookie(SESSION_COOKIE, session)
+        raise response
+
+    async def _energy_handler(self, request):
+        if request.cookies.get(SESSION_COOKIE) not in self._sessions:
+            raise web.HTTPFound("/login")
+        return web.Response(text="<html><body>Energy</body></html>", content_type="text/html")
+
+    def _json_handler(self, key):
+        async def handler(request):
+            if request.cookies.get(SESSION_COOKIE) not in self._sessions:
+                raise web.HTTPFound("/login")
+            if self.failure_rate and random.random() < self.failure_rate:
+                return web.Response(status=self.failure_status, headers={"Retry-After": "1"})
+            body, etag = self._body(key, request.query)
+            if self.etags and request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            headers = {"ETag": etag} if self.etags else {}
+            return web.Response(body=body, content_type="application/json", headers=headers)
+        return handler
+
+    def _body(self, key, query):
+        """Return the encoded fixture and its ETag, paging payments like the portal."""
+        page = int(query.get("page", 1))
+        per_page = int(query.get("per_page", 50))
+        cache_key = (key, page, per_page) if key == "payments" else (key,)
+        if cache_key not in self._bodies:
+            payload = self._fixtures[key]
+            if key == "payments":
+                payload = {**payload, "payments": payload["payments"][(page - 1) * per_page:page * per_page]}
+            body = json.dumps(payload).encode()
+            self._bodies[cache_key] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+        return self._bodies[cache_key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the recorded Utilita fixtures locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of JSON requests that fail")
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--no-etags", action="store_true", help="never answer 304 Not Modified")
+    args = parser.parse_args()
+    portal = FakePortal(args.latency, args.failure_rate, args.failure_status, not args.no_etags)
+    web.run_app(portal.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
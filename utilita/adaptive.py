@@ -0,0 +1,74 @@
+from homeassistant.util import dt as dt_util
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+MIN_INTERVAL = 300
+MAX_INTERVAL = 21600
+# Poll this long after the meter is expected to report, to give the portal time to catch up.
+REPORT_GRACE = 300
+# Poll at least this often when a balance is close to running out.
+URGENT_INTERVAL = 900
+URGENT_WINDOW = 86400
+EMERGENCY_CREDIT_IDLE = ("available", "unavailable", "unknown", "not available")
+
+
+def _parse_time(value):
+    """Parse a portal timestamp, treating naive values as local time."""
+    if not value:
+        return None
+    parsed = dt_util.parse_datetime(str(value))
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+    return parsed
+
+
+class AdaptivePolling:
+    """Work out when the balance is next worth fetching from the meter report times."""
+
+    def __init__(self, base_interval):
+        self._base_interval = base_interval
+        self._cadence = base_interval
+        self._last_updated = None
+        self._unchanged = 0
+
+    def next_interval(self, balances, now=None):
+        """Return the number of seconds until the balance should be fetched again."""
+        now = now or dt_util.now()
+        attributes = [balance.attributes for balance in balances.values()]
+        updated = [time for time in (_parse_time(attrs.get("updated")) for attrs in attributes) if time]
+        if not updated:
+            return self._base_interval
+        last_updated = max(updated)
+        if self._last_updated is not None and last_updated > self._last_updated:
+            # Learn how often the meter reports, weighting recent reports more.
+            seen = (last_updated - self._last_updated).total_seconds()
+            self._cadence = 0.7 * self._cadence + 0.3 * seen
+            self._unchanged = 0
+        elif self._last_updated is not None:
+            self._unchanged += 1
+        self._last_updated = last_updated
+
+        until_report = (last_updated - now).total_seconds() + self._cadence + REPORT_GRACE
+        if until_report > 0:
+            interval = until_report
+        else:
+            # The report is overdue, so back off while nothing changes.
+            interval = MIN_INTERVAL * 2 ** min(self._unchanged, 6)
+        if self._is_urgent(attributes, now):
+            interval = min(interval, URGENT_INTERVAL)
+        interval = int(max(MIN_INTERVAL, min(interval, MAX_INTERVAL)))
+        _LOGGER.debug(f"Adaptive balance interval {interval}s (cadence {self._cadence:.0f}s, unchanged {self._unchanged})")
+        return interval
+
+    @staticmethod
+    def _is_urgent(attributes, now):
+        for attrs in attributes:
+            zero_time = _parse_time(attrs.get("zero_time"))
+            if zero_time is not None and (zero_time - now).total_seconds() < URGENT_WINDOW:
+                return True
+            if str(attrs.get("emergency_credit_status", "")).lower() not in EMERGENCY_CREDIT_IDLE:
+                return True
+        return False
@@ -0,0 +1,187 @@
+import logging
+from array import array
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import accumulate
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_WINDOW_DAYS = 730
+# Heating degree days are counted below this mean outdoor temperature (°C), as in UK gas forecasting.
+HEATING_BASE_TEMPERATURE = 15.5
+# Days used to learn how consumption follows temperature.
+FIT_DAYS = 365
+# Days averaged into the weekday profile.
+PROFILE_DAYS = 84
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def parse_windows(value):
+    """Turn a comma separated list of day counts into sorted unique windows, raising ValueError if invalid."""
+    windows = set()
+    for item in str(value or "").replace(" ", "").split(","):
+        if not item:
+            continue
+        days = int(item)
+        if not 1 <= days <= MAX_WINDOW_DAYS:
+            raise ValueError(f"Window of {days} days is not between 1 and {MAX_WINDOW_DAYS}")
+        windows.add(days)
+    return tuple(sorted(windows))
+
+
+@dataclass(slots=True)
+class WindowStats:
+    """Usage over the last N days of the history."""
+
+    days_with_data: int
+    kwh: float | None
+    mean_kwh: float | None
+    cost: float | None
+    mean_cost: float | None
+    normalised_mean_kwh: float | None
+
+
+@dataclass(slots=True)
+class SupplyAnalytics:
+    """Rolling windows, weekday profile and temperature response of one supply."""
+
+    supply_id: str
+    last_date: str
+    windows: dict = field(default_factory=dict)
+    weekday_kwh: dict = field(default_factory=dict)
+    base_load_kwh: float | None = None
+    kwh_per_degree_day: float | None = None
+
+
+def _round(value, places=3):
+    return round(value, places) if value is not None else None
+
+
+class _Series:
+    """Daily values of one supply laid out by day offset, with prefix sums for O(1) windows."""
+
+    def __init__(self, rows):
+        self.first = date.fromisoformat(rows[0]["date"][:10])
+        self.length = (date.fromisoformat(rows[-1]["date"][:10]) - self.first).days + 1
+        kwh = array("d", bytes(8 * self.length))
+        pence = array("d", bytes(8 * self.length))
+        hdd = array("d", bytes(8 * self.length))
+        has_kwh = array("d", bytes(8 * self.length))
+        has_pence = array("d", bytes(8 * self.length))
+        has_hdd = array("d", bytes(8 * self.length))
+        for row in rows:
+            index = (date.fromisoformat(row["date"][:10]) - self.first).days
+            if row.get("kwh") is not None:
+                kwh[index] = float(row["kwh"])
+                has_kwh[index] = 1
+            if row.get("pence") is not None:
+                pence[index] = float(row["pence"])
+                has_pence[index] = 1
+            if row.get("kwh") is not None and row.get("avg_temperature_c") is not None:
+                hdd[index] = max(0.0, HEATING_BASE_TEMPERATURE - float(row["avg_temperature_c"]))
+                has_hdd[index] = 1
+        # Only days with both a reading and a temperature feed the regression sums.
+        kwh_with_hdd = array("d", (value * present for value, present in zip(kwh, has_hdd)))
+        self.kwh = kwh
+        self.hdd = hdd
+        self.has_hdd = has_hdd
+        self.prefix = {
+            name: array("d", accumulate(values, initial=0.0))
+            for name, values in (
+                ("kwh", kwh),
+                ("pence", pence),
+                ("hdd", hdd),
+                ("has_kwh", has_kwh),
+                ("has_pence", has_pence),
+                ("has_hdd", has_hdd),
+                ("kwh_with_hdd", kwh_with_hdd),
+                ("hdd_squared", array("d", (value * value for value in hdd))),
+                ("kwh_hdd", array("d", (a * b for a, b in zip(kwh, hdd)))),
+            )
+        }
+
+    def total(self, name, days):
+        """Sum of a series over the last `days` days."""
+        prefix = self.prefix[name]
+        return prefix[self.length] - prefix[max(0, self.length - days)]
+
+
+def _fit(series):
+    """Least squares fit of daily kWh against heating degree days, as (base load, kWh per degree day)."""
+    count = series.total("has_hdd", FIT_DAYS)
+    if count < 14:
+        return None, None
+    sum_hdd = series.total("hdd", FIT_DAYS)
+    sum_kwh = series.total("kwh_with_hdd", FIT_DAYS)
+    variance = series.total("hdd_squared", FIT_DAYS) - sum_hdd * sum_hdd / count
+    if variance <= 1e-9:
+        # No spread in temperature yet, e.g. a summer-only history.
+        return sum_kwh / count, 0.0
+    slope = (series.total("kwh_hdd", FIT_DAYS) - sum_hdd * sum_kwh / count) / variance
+    return (sum_kwh - slope * sum_hdd) / count, slope
+
+
+def _weekday_profile(series):
+    start = max(0, series.length - PROFILE_DAYS)
+    totals = [0.0] * 7
+    counts = [0] * 7
+    first_weekday = series.first.weekday()
+    prefix = series.prefix["has_kwh"]
+    for index in range(start, series.length):
+        if prefix[index + 1] - prefix[index]:
+            weekday = (first_weekday + index) % 7
+            totals[weekday] += series.kwh[index]
+            counts[weekday] += 1
+    return {name: _round(totals[day] / counts[day]) if counts[day] else None for day, name in enumerate(WEEKDAYS)}
+
+
+def _supply_analytics(supply_id, rows, windows):
+    series = _Series(rows)
+    base_load, slope = _fit(series)
+    fit_days = series.total("has_hdd", FIT_DAYS)
+    typical_hdd = series.total("hdd", FIT_DAYS) / fit_days if fit_days else None
+    stats = {}
+    for days in windows:
+        kwh_days = int(series.total("has_kwh", days))
+        pence_days = int(series.total("has_pence", days))
+        kwh = series.total("kwh", days) if kwh_days else None
+        pence = series.total("pence", days) if pence_days else None
+        mean_kwh = kwh / kwh_days if kwh_days else None
+        normalised = None
+        hdd_days = series.total("has_hdd", days)
+        if slope is not None and hdd_days:
+            # What the window would have averaged in typical weather for this history.
+            window_hdd = series.total("hdd", days) / hdd_days
+            normalised = series.total("kwh_with_hdd", days) / hdd_days - slope * (window_hdd - typical_hdd)
+        stats[days] = WindowStats(
+            days_with_data=kwh_days,
+            kwh=_round(kwh),
+            mean_kwh=_round(mean_kwh),
+            cost=_round(pence / 100, 2) if pence is not None else None,
+            mean_cost=_round(pence / 100 / pence_days, 2) if pence is not None else None,
+            normalised_mean_kwh=_round(normalised),
+        )
+    return SupplyAnalytics(
+        supply_id=supply_id,
+        last_date=rows[-1]["date"][:10],
+        windows=stats,
+        weekday_kwh=_weekday_profile(series),
+        base_load_kwh=_round(base_load),
+        kwh_per_degree_day=_round(slope),
+    )
+
+
+def build_analytics(history, windows):
+    """Return the analytics of the first stored supply of each type, keyed by supply type."""
+    analytics = {}
+    for supply_id, supply_type in history.supplies.items():
+        if supply_type in analytics:
+            continue
+        rows = history.rows(supply_id)
+        if not rows:
+            continue
+        try:
+            analytics[supply_type] = _supply_analytics(supply_id, rows, windows)
+        except (TypeError, ValueError) as err:
+            _LOGGER.error(f"Error analysing usage history of supply {supply_id}: {err}")
+    return analytics
@@ -0,0 +1,408 @@
+import aiohttp
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from datetime import date
+from email.utils import parsedate_to_datetime
+from yarl import URL
+from .metrics import UtilitaMetrics
+from .scheduler import UtilitaScheduler
+from .validation import SchemaMonitor, validate_payload
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# orjson decodes the portal payloads two to three times faster than the standard library.
+JSON_DECODER = orjson.loads if orjson is not None else json.loads
+# Bodies at least this large are decoded in an executor rather than on the event
+# loop; a year of usage history is around this size.
+EXECUTOR_DECODE_THRESHOLD = 64 * 1024
+
+BASE_URL = "https://my.utilita.co.uk"
+LOGIN_URL = f"{BASE_URL}/login"
+MAX_CONCURRENT_REQUESTS = 3
+ENDPOINTS = {
+    "balance": "/json/balance",
+    "usage": "/json/usage?end_date={today}",
+    "user_data": "/user-data",
+    "payments": "/json/payments?page=1&per_page=50",
+}
+PAYMENTS_PATH = "/json/payments?page={page}&per_page={per_page}"
+# Metrics are recorded per endpoint key, whatever the query string.
+ENDPOINT_NAMES = {path.split("?")[0]: key for key, path in ENDPOINTS.items()}
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 2.0
+# A Retry-After longer than this is not waited out; the circuit is opened for it instead.
+MAX_RETRY_AFTER = 120
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_OPEN_SECONDS = 300
+CIRCUIT_MAX_OPEN_SECONDS = 3600
+_SESSION_EXPIRED = object()
+# Returned instead of a payload when the endpoint has not changed since the last fetch.
+NOT_MODIFIED = object()
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+CSRF_INPUT_RE = re.compile(r'<input type="hidden" name="_token" value="([^"]+)"')
+CSRF_META_RE = re.compile(r'<meta name="csrf-token" content="([^"]+)"', re.IGNORECASE)
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+# Sent with every request by the session; the per-request dicts below only add what differs.
+SESSION_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+}
+PAGE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Upgrade-Insecure-Requests": "1",
+}
+LOGIN_POST_HEADERS = {**PAGE_HEADERS, "Referer": LOGIN_URL}
+JSON_HEADERS = {
+    "Accept": "application/json",
+    "Referer": f"{BASE_URL}/energy",
+}
+# Connection pool of each client's own session: connections to the portal are
+# kept alive between refreshes and its address is cached rather than resolved
+# for every request.
+POOL_LIMIT = 4
+KEEPALIVE_TIMEOUT = 120
+DNS_CACHE_TTL = 600
+
+
+class UtilitaError(Exception):
+    """Error talking to the Utilita portal."""
+
+
+class UtilitaAuthError(UtilitaError):
+    """Login to the Utilita portal failed."""
+
+
+class UtilitaRetryableError(UtilitaError):
+    """Temporary portal failure, such as a 429 or 5xx response."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UtilitaSchemaError(UtilitaError):
+    """A payload is missing fields the integration relies on."""
+
+
+class UtilitaCircuitOpenError(UtilitaError):
+    """Requests are paused after repeated portal failures."""
+
+
+def _retry_after(value):
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _endpoint_name(path):
+    base = path.split("?")[0]
+    return ENDPOINT_NAMES.get(base, base)
+
+
+class CircuitBreaker:
+    """Stop calling the portal for a while after repeated failures.
+
+    Failures while the circuit is open, such as the other endpoints of the
+    refresh that opened it, are not counted again. Once the pause is over a
+    single request is let through as a trial and the rest are still refused.
+    If the trial fails the circuit opens again for twice as long, up to an
+    hour; any success closes it.
+    """
+
+    def __init__(self):
+        self._failures = 0
+        self._open_until = 0.0
+        self._open_seconds = CIRCUIT_OPEN_SECONDS
+        self._tripped = False
+        self._trial = False
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self._open_until or self._trial
+
+    def check(self):
+        """Raise if requests are paused, otherwise return whether this request is the trial."""
+        remaining = self._open_until - time.monotonic()
+        if remaining > 0:
+            raise UtilitaCircuitOpenError(f"Portal requests paused for {remaining:.0f}s after repeated failures")
+        if not self._tripped:
+            return False
+        if self._trial:
+            raise UtilitaCircuitOpenError("Portal requests paused until a trial request succeeds")
+        self._trial = True
+        return True
+
+    def end_trial(self):
+        self._trial = False
+
+    def open_for(self, seconds):
+        self._open_until = max(self._open_until, time.monotonic() + seconds)
+
+    def record_success(self):
+        self._failures = 0
+        self._tripped = False
+        self._open_seconds = CIRCUIT_OPEN_SECONDS
+
+    def record_failure(self, trial=False):
+        if trial:
+            self._open_seconds = min(self._open_seconds * 2, CIRCUIT_MAX_OPEN_SECONDS)
+            _LOGGER.warning(f"Trial request to the Utilita portal failed, pausing requests for {self._open_seconds}s")
+            self.open_for(self._open_seconds)
+            return
+        if self._tripped:
+            return
+        self._failures += 1
+        if self._failures >= CIRCUIT_FAILURE_THRESHOLD:
+            _LOGGER.warning(f"Pausing Utilita portal requests for {self._open_seconds}s after {self._failures} failures")
+            self._tripped = True
+            self.open_for(self._open_seconds)
+
+
+def create_session(ssl_context=None):
+    """Create a session with a dedicated, keep-alive connection pool and its own cookie jar."""
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ssl=ssl_context if ssl_context is not None else True,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        cookie_jar=aiohttp.CookieJar(),
+        headers=SESSION_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+        auto_decompress=True,
+    )
+
+
+class UtilitaClient:
+    """Authenticated client for the Utilita portal that reuses its session cookies.
+
+    The config flow, coordinator and services all go through this client. It
+    owns its session, so close it with async_close when done. base_url points it
+    at another portal, such as the offline one in benchmarks/. decoder turns a
+    response body into JSON; bodies of executor_threshold bytes or more are
+    decoded in an executor, and None decodes everything on the event loop.
+    """
+
+    def __init__(
+        self,
+        email,
+        password,
+        scheduler=None,
+        ssl_context=None,
+        base_url=BASE_URL,
+        decoder=JSON_DECODER,
+        executor_threshold=EXECUTOR_DECODE_THRESHOLD,
+    ):
+        self._session = create_session(ssl_context)
+        self._decoder = decoder
+        self._executor_threshold = executor_threshold
+        self._base_url = base_url
+        self._login_url = f"{base_url}/login"
+        self._scheduler = scheduler or UtilitaScheduler()
+        self._email = email
+        self._password = password
+        self._login_lock = asyncio.Lock()
+        self._login_count = 0
+        self._request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._validators = {}
+        self._body_hashes = {}
+        self.breaker = CircuitBreaker()
+        self.metrics = UtilitaMetrics()
+        self.schema = SchemaMonitor()
+
+    @property
+    def email(self):
+        return self._email
+
+    async def async_close(self):
+        await self._session.close()
+
+    def forget_payload(self, name):
+        """Drop the cached hash and validators of an endpoint, so its next response is returned in full."""
+        self._body_hashes.pop(name, None)
+        self._validators.pop(name, None)
+
+    def export_cookies(self):
+        """Return the portal cookies as a plain dict for persistence."""
+        return {key: morsel.value for key, morsel in self._session.cookie_jar.filter_cookies(URL(self._base_url)).items()}
+
+    def import_cookies(self, cookies):
+        """Restore previously exported portal cookies into the session."""
+        if cookies:
+            self._session.cookie_jar.update_cookies(cookies, URL(self._base_url))
+
+    async def async_login(self):
+        """Log in, holding one of the scheduler's login slots."""
+        async with self._scheduler.login():
+            with self.metrics.timer("login"):
+                await self._async_login()
+
+    async def _async_login(self):
+        """Scrape the CSRF token from the login page and post the credentials."""
+        async with self._scheduler.request(), self._session.get(self._login_url, headers=PAGE_HEADERS, allow_redirects=True) as response:
+            if response.status != 200:
+                raise UtilitaAuthError(f"Failed to load login page: HTTP {response.status}, URL: {response.url}")
+            login_page = await response.text()
+            _LOGGER.debug(f"Login page URL: {response.url}, Headers: {response.headers}")
+            with self.metrics.timer("csrf"):
+                match = CSRF_INPUT_RE.search(login_page) or CSRF_META_RE.search(login_page)
+            if not match:
+                snippet = login_page[:1000]
+                _LOGGER.error(f"CSRF token not found. Login page snippet: {snippet}")
+                raise UtilitaAuthError("CSRF token not found")
+            token = match.group(1)
+            _LOGGER.debug(f"CSRF token found: {token[:10]}...")
+        async with self._scheduler.request(), self._session.post(
+            self._login_url,
+            data={"_token": token, "email": self._email, "password": self._password, "remember": "on"},
+            headers=LOGIN_POST_HEADERS,
+        ) as response:
+            if response.status != 200 or "login" in str(response.url):
+                raise UtilitaAuthError(f"Login failed: HTTP {response.status}, URL: {response.url}")
+        self._login_count += 1
+        _LOGGER.debug("Logged in to Utilita portal")
+
+    async def _async_fetch_json(self, path, conditional=False):
+        """GET a JSON endpoint, returning _SESSION_EXPIRED when the session is no longer authenticated.
+
+        Conditional fetches send the validators from the previous response and
+        return NOT_MODIFIED on a 304 or when the body hashes the same as last time.
+        """
+        # Cached per endpoint rather than per path, as the usage path changes every day.
+        name = _endpoint_name(path)
+        headers = JSON_HEADERS
+        if conditional and name in self._validators:
+            headers = dict(JSON_HEADERS)
+            etag, last_modified = self._validators[name]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        stage = self.metrics.stage(name)
+        stage.counters["requests"] += 1
+        async with self._request_semaphore, self._scheduler.request():
+            start = time.perf_counter()
+            async with self._session.get(f"{self._base_url}{path}", headers=headers) as response:
+                if response.status == 401 or response.url.path.rstrip("/") == "/login":
+                    stage.counters["session_expired"] += 1
+                    return _SESSION_EXPIRED
+                if response.status == 304 and conditional:
+                    stage.latency.append(time.perf_counter() - start)
+                    stage.counters["not_modified"] += 1
+                    return NOT_MODIFIED
+                if response.status == 429 or response.status >= 500:
+                    raise UtilitaRetryableError(
+                        f"Failed to fetch {path}: HTTP {response.status}",
+                        _retry_after(response.headers.get("Retry-After")),
+                    )
+                if response.status != 200:
+                    raise UtilitaError(f"Failed to fetch {path}: HTTP {response.status}")
+                body = await response.read()
+                stage.latency.append(time.perf_counter() - start)
+                stage.size.append(len(body))
+                if conditional:
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    if etag or last_modified:
+                        self._validators[name] = (etag, last_modified)
+                    digest = hashlib.blake2b(body, digest_size=16).digest()
+                    if self._body_hashes.get(name) == digest:
+                        stage.counters["not_modified"] += 1
+                        return NOT_MODIFIED
+                    self._body_hashes[name] = digest
+        with self.metrics.timer(name, "decode"):
+            try:
+                if self._executor_threshold is not None and len(body) >= self._executor_threshold:
+                    stage.counters["executor_decodes"] += 1
+                    data = await asyncio.get_running_loop().run_in_executor(None, self._decoder, body)
+                else:
+                    data = self._decoder(body)
+            except ValueError as err:
+                # Such as an HTML maintenance page served with a 200; orjson and json errors are both ValueErrors.
+                self.forget_payload(name)
+                raise UtilitaRetryableError(f"Failed to decode {path}: {err}") from err
+        with self.metrics.timer(name, "validate"):
+            problems = validate_payload(name, data)
+        self.schema.record(name, problems)
+        if problems:
+            stage.counters["schema_errors"] += 1
+            # Fetch the payload again next time rather than treating it as unchanged.
+            self.forget_payload(name)
+            raise UtilitaSchemaError(f"Unexpected {name} payload: {problems[0]}")
+        return data
+
+    async def _async_fetch_with_retries(self, path, conditional):
+        """Fetch a JSON endpoint, retrying temporary failures with exponential backoff and jitter."""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return await self._async_fetch_json(path, conditional)
+            except (aiohttp.ClientError, asyncio.TimeoutError, UtilitaRetryableError) as err:
+                retry_after = getattr(err, "retry_after", None)
+                if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                    self.breaker.open_for(retry_after)
+                    raise
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                delay = retry_after if retry_after is not None else RETRY_BACKOFF * 2 ** (attempt - 1)
+                delay += random.uniform(0, RETRY_BACKOFF)
+                _LOGGER.debug(f"Retrying {path} in {delay:.1f}s after attempt {attempt} failed: {err!r}")
+                self.metrics.count(_endpoint_name(path), "retries")
+                await asyncio.sleep(delay)
+
+    async def async_get_json(self, path, conditional=False):
+        """Fetch a JSON endpoint, logging in again only if the session has expired."""
+        trial = self.breaker.check()
+        try:
+            data = await self._async_get_json(path, conditional)
+        except (UtilitaAuthError, UtilitaSchemaError):
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, UtilitaError):
+            self.metrics.count(_endpoint_name(path), "errors")
+            self.breaker.record_failure(trial)
+            raise
+        finally:
+            # A trial ended without a verdict, e.g. by an auth error, lets the next request try.
+            if trial:
+                self.breaker.end_trial()
+        self.breaker.record_success()
+        return data
+
+    async def _async_get_json(self, path, conditional):
+        login_count = self._login_count
+        data = await self._async_fetch_with_retries(path, conditional)
+        if data is _SESSION_EXPIRED:
+            async with self._login_lock:
+                # Another request may already have logged in again while this one waited.
+                if self._login_count == login_count:
+                    _LOGGER.debug(f"Session expired while fetching {path}, logging in again")
+                    await self.async_login()
+            data = await self._async_fetch_with_retries(path, conditional)
+            if data is _SESSION_EXPIRED:
+                raise UtilitaAuthError(f"Still not authenticated after login while fetching {path}")
+        return data
+
+    async def async_get_endpoint(self, key):
+        """Fetch one of the known data endpoints by key, or NOT_MODIFIED if it is unchanged."""
+        return await self.async_get_json(ENDPOINTS[key].format(today=date.today()), conditional=True)
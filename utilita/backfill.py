@@ -0,0 +1,116 @@
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+import asyncio
+import logging
+from datetime import date, timedelta
+from .api import ENDPOINTS
+from .const import DOMAIN, STORAGE_VERSION
+
+_LOGGER = logging.getLogger(__name__)
+
+# Usage chunks fetched at once; the shared scheduler still caps the overall request rate.
+BACKFILL_CONCURRENCY = 3
+CHECKPOINT_SAVE_DELAY = 5
+
+
+def _row_dates(payload):
+    return [row["date"][:10] for supply in payload["data"]["data"] for row in supply.get("usage") or []]
+
+
+class UsageBackfill:
+    """Load older usage into the history by walking the usage end_date back in chunks.
+
+    Every usage response covers a fixed number of days up to its end_date. The
+    newest chunk is fetched first to learn that span, then the older chunk end
+    dates are fetched in parallel. Chunks share their boundary day, and the
+    history is keyed by date, so the overlap is merged away. Completed chunks
+    are checkpointed, so an interrupted backfill of the same range resumes.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, client, history) -> None:
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}.backfill")
+        self._client = client
+        self._history = history
+
+    async def _async_fetch(self, end):
+        return await self._client.async_get_json(ENDPOINTS["usage"].format(today=end.isoformat()))
+
+    async def async_unfinished_range(self):
+        """Return the (start, end) dates of an interrupted backfill, or None if there is none."""
+        checkpoint = await self._store.async_load()
+        if not checkpoint:
+            return None
+        return date.fromisoformat(checkpoint["start"]), date.fromisoformat(checkpoint["end"])
+
+    async def _async_clear_checkpoint(self):
+        # Store.async_remove keeps a pending delayed save in memory and would
+        # return it from the next load, so write an empty checkpoint first.
+        await self._store.async_save({})
+        await self._store.async_remove()
+
+    async def async_run(self, start: date, end: date):
+        """Backfill the usage between two dates and return a summary of what was fetched."""
+        checkpoint = await self._store.async_load()
+        if not checkpoint or (checkpoint["start"], checkpoint["end"]) != (start.isoformat(), end.isoformat()):
+            checkpoint = {"start": start.isoformat(), "end": end.isoformat(), "step": None, "done": []}
+        elif checkpoint["done"]:
+            _LOGGER.info(f"Resuming usage backfill from {start} to {end}, {len(checkpoint['done'])} chunks already done")
+        done = set(checkpoint["done"])
+        changed = 0
+        earliest = None
+
+        def finish_chunk(chunk_end, payload):
+            nonlocal changed, earliest
+            chunk_changed, chunk_earliest = self._history.merge(payload)
+            changed += chunk_changed
+            if chunk_earliest is not None and (earliest is None or chunk_earliest < earliest):
+                earliest = chunk_earliest
+            done.add(chunk_end.isoformat())
+            checkpoint["done"] = sorted(done)
+            self._store.async_delay_save(lambda: checkpoint, CHECKPOINT_SAVE_DELAY)
+
+        if checkpoint["step"] is None:
+            payload = await self._async_fetch(end)
+            dates = _row_dates(payload)
+            if not dates:
+                _LOGGER.info(f"No usage returned up to {end}, nothing to backfill")
+                await self._async_clear_checkpoint()
+                return {"chunks_done": 1, "chunks_failed": 0, "changed_rows": 0, "earliest_changed": None, "step_days": None}
+            checkpoint["step"] = max(1, (end - date.fromisoformat(min(dates))).days)
+            finish_chunk(end, payload)
+
+        step = timedelta(days=checkpoint["step"])
+        chunk_ends = []
+        chunk_end = end
+        # Each chunk reaches back `step` days from its end date.
+        while chunk_end - step > start:
+            chunk_end -= step
+            if chunk_end.isoformat() not in done:
+                chunk_ends.append(chunk_end)
+        _LOGGER.debug(f"Backfilling usage from {start} to {end} in {len(chunk_ends)} chunks of {step.days} days")
+
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        async def fetch_chunk(chunk_end):
+            async with semaphore:
+                payload = await self._async_fetch(chunk_end)
+            finish_chunk(chunk_end, payload)
+
+        results = await asyncio.gather(*(fetch_chunk(chunk_end) for chunk_end in chunk_ends), return_exceptions=True)
+        failed = []
+        for chunk_end, result in zip(chunk_ends, results):
+            if isinstance(result, Exception):
+                _LOGGER.warning(f"Failed to backfill usage up to {chunk_end}: {result}")
+                failed.append(chunk_end)
+        if failed:
+            await self._store.async_save(checkpoint)
+        else:
+            await self._async_clear_checkpoint()
+        _LOGGER.info(f"Backfilled usage from {start} to {end}: {changed} new or changed rows, {len(failed)} chunks failed")
+        return {
+            "chunks_done": len(done),
+            "chunks_failed": len(failed),
+            "changed_rows": changed,
+            "earliest_changed": earliest,
+            "step_days": step.days,
+        }
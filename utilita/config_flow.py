@@ -1,119 +1,162 @@
-import voluptuous as vol
-from homeassistant import config_entries
-from homeassistant.core import callback
-from homeassistant.helpers import aiohttp_client
-import re
-import logging
-from .const import DOMAIN, CONF_EMAIL, CONF_PASSWORD, CONF_REFRESH_RATE
-
-_LOGGER = logging.getLogger(__name__)
-
-class UtilitaConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
-    """Handle a config flow for Utilita."""
-
-    VERSION = 1
-    CONNECTION_CLASS = config_entries.CONN_CLASS_CLOUD_POLL
-
-    async def async_step_user(self, user_input=None):
-        """Handle the initial step."""
-        errors = {}
-        if user_input is not None:
-            email = user_input[CONF_EMAIL]
-            password = user_input[CONF_PASSWORD]
-            refresh_rate = user_input[CONF_REFRESH_RATE]
-
-            try:
-                session = aiohttp_client.async_get_clientsession(self.hass)
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                    "Accept-Language": "en-US,en;q=0.5",
-                    "Connection": "keep-alive",
-                    "Upgrade-Insecure-Requests": "1",
-                }
-                async with session.get("https://my.utilita.co.uk/login", timeout=10, headers=headers, allow_redirects=True) as response:
-                    if response.status != 200:
-                        _LOGGER.error(f"Failed to load login page: HTTP {response.status}, URL: {response.url}")
-                        raise Exception(f"Failed to load login page: HTTP {response.status}")
-                    login_page = await response.text()
-                    _LOGGER.debug(f"Login page URL: {response.url}, Headers: {response.headers}")
-                    match = re.search(r'<input type="hidden" name="_token" value="([^"]+)"', login_page)
-                    if not match:
-                        match = re.search(r'<meta name="csrf-token" content="([^"]+)"', login_page, re.IGNORECASE)
-                    if not match:
-                        snippet = login_page[:1000]
-                        _LOGGER.error(f"CSRF token not found in config flow. Login page snippet: {snippet}")
-                        raise Exception("CSRF token not found")
-                    token = match.group(1)
-                    _LOGGER.debug(f"CSRF token found in config flow: {token[:10]}...")
-                async with session.post(
-                    "https://my.utilita.co.uk/login",
-                    data={"_token": token, "email": email, "password": password, "remember": "on"},
-                    timeout=10,
-                    headers={
-                        "User-Agent": headers["User-Agent"],
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                        "Accept-Language": "en-US,en;q=0.5",
-                        "Referer": "https://my.utilita.co.uk/login",
-                        "Connection": "keep-alive",
-                        "Upgrade-Insecure-Requests": "1",
-                    }
-                ) as response:
-                    if response.status != 200 or "login" in str(response.url):
-                        _LOGGER.error(f"Login failed in config flow: HTTP {response.status}, URL: {response.url}")
-                        raise Exception("Invalid credentials or redirect")
-                return self.async_create_entry(
-                    title="Utilita Energy",
-                    data={
-                        CONF_EMAIL: email,
-                        CONF_PASSWORD: password,
-                        CONF_REFRESH_RATE: refresh_rate,
-                    },
-                )
-            except Exception as err:
-                _LOGGER.error(f"Config flow error: {err}")
-                errors["base"] = "auth_failed"
-
-        return self.async_show_form(
-            step_id="user",
-            data_schema=vol.Schema(
-                {
-                    vol.Required(CONF_EMAIL): str,
-                    vol.Required(CONF_PASSWORD): str,
-                    vol.Required(CONF_REFRESH_RATE, default=3600): vol.All(
-                        vol.Coerce(int), vol.Range(min=300)
-                    ),
-                }
-            ),
-            errors=errors,
-        )
-
-    @staticmethod
-    @callback
-    def async_get_options_flow(config_entry):
-        return UtilitaOptionsFlow(config_entry)
-
-class UtilitaOptionsFlow(config_entries.OptionsFlow):
-    """Handle options flow."""
-
-    def __init__(self, config_entry):
-        self.config_entry = config_entry
-        _LOGGER.debug(f"Initializing options flow for entry: {config_entry.entry_id}")
-
-    async def async_step_init(self, user_input=None):
-        """Manage the options."""
-        if user_input is not None:
-            _LOGGER.debug(f"Updating options with refresh_rate: {user_input[CONF_REFRESH_RATE]} for entry: {self.config_entry.entry_id}")
-            return self.async_create_entry(title="", data=user_input)
-
-        return self.async_show_form(
-            step_id="init",
-            data_schema=vol.Schema(
-                {
-                    vol.Required(
-                        CONF_REFRESH_RATE,
-                        default=self.config_entry.options.get(CONF_REFRESH_RATE, self.config_entry.data.get(CONF_REFRESH_RATE, 3600)),
-                    ): vol.All(vol.Coerce(int), vol.Range(min=300)),
-                }
-            ),
+import voluptuous as vol
+from homeassistant import config_entries
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.util.ssl import get_default_context
+import logging
+from .analytics import parse_windows
+from .api import UtilitaClient
+from .const import (
+    DOMAIN,
+    DATA_PENDING_CLIENTS,
+    DATA_SCHEDULER,
+    CONF_EMAIL,
+    CONF_PASSWORD,
+    CONF_REFRESH_RATE,
+    CONF_ADAPTIVE_POLLING,
+    CONF_USAGE_REFRESH_RATE,
+    CONF_TARIFF_REFRESH_RATE,
+    CONF_PAYMENTS_REFRESH_RATE,
+    CONF_USAGE_WINDOWS,
+    DEFAULT_REFRESH_RATE,
+    DEFAULT_USAGE_REFRESH_RATE,
+    DEFAULT_TARIFF_REFRESH_RATE,
+    DEFAULT_PAYMENTS_REFRESH_RATE,
+    DEFAULT_USAGE_WINDOWS,
+)
+from .scheduler import UtilitaScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+# A logged-in client not picked up by a new entry within this time is closed.
+PENDING_CLIENT_TIMEOUT = 300
+
+def _hand_off_client(hass, client):
+    """Keep the logged-in client so the first refresh of the new entry can reuse its session."""
+    pending = hass.data.setdefault(DATA_PENDING_CLIENTS, {})
+    key = client.email.lower()
+    if key in pending:
+        hass.async_create_task(pending.pop(key).async_close())
+    pending[key] = client
+
+    async def _async_discard(_now_or_event):
+        if pending.get(key) is client:
+            del pending[key]
+            await client.async_close()
+
+    async_call_later(hass, PENDING_CLIENT_TIMEOUT, _async_discard)
+    # Or when Home Assistant stops first; a client an entry has picked up is closed by the entry.
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_discard)
+
+def _usage_windows(value):
+    """Validate a comma separated list of day counts and return it normalised."""
+    try:
+        windows = parse_windows(value)
+    except ValueError as err:
+        raise vol.Invalid(f"Invalid usage windows: {err}") from err
+    return ", ".join(str(days) for days in windows)
+
+class UtilitaConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
+    """Handle a config flow for Utilita."""
+
+    VERSION = 1
+    CONNECTION_CLASS = config_entries.CONN_CLASS_CLOUD_POLL
+
+    async def async_step_user(self, user_input=None):
+        """Handle the initial step."""
+        errors = {}
+        if user_input is not None:
+            email = user_input[CONF_EMAIL]
+            password = user_input[CONF_PASSWORD]
+            refresh_rate = user_input[CONF_REFRESH_RATE]
+
+            client = UtilitaClient(
+                email, password, self.hass.data.setdefault(DATA_SCHEDULER, UtilitaScheduler()), get_default_context()
+            )
+            try:
+                await client.async_login()
+            except Exception as err:
+                _LOGGER.error(f"Config flow error: {err}")
+                errors["base"] = "auth_failed"
+                await client.async_close()
+            else:
+                _hand_off_client(self.hass, client)
+                return self.async_create_entry(
+                    title="Utilita Energy",
+                    data={
+                        CONF_EMAIL: email,
+                        CONF_PASSWORD: password,
+                        CONF_REFRESH_RATE: refresh_rate,
+                    },
+                )
+
+        return self.async_show_form(
+            step_id="user",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(CONF_EMAIL): str,
+                    vol.Required(CONF_PASSWORD): str,
+                    vol.Required(CONF_REFRESH_RATE, default=DEFAULT_REFRESH_RATE): vol.All(
+                        vol.Coerce(int), vol.Range(min=300)
+                    ),
+                }
+            ),
+            errors=errors,
+        )
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return UtilitaOptionsFlow(config_entry)
+
+class UtilitaOptionsFlow(config_entries.OptionsFlow):
+    """Handle options flow."""
+
+    def __init__(self, config_entry):
+        self.config_entry = config_entry
+        _LOGGER.debug(f"Initializing options flow for entry: {config_entry.entry_id}")
+
+    async def async_step_init(self, user_input=None):
+        """Manage the options."""
+        if user_input is not None:
+            _LOGGER.debug(f"Updating options with refresh_rate: {user_input[CONF_REFRESH_RATE]} for entry: {self.config_entry.entry_id}")
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        data = self.config_entry.data
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(
+                        CONF_REFRESH_RATE,
+                        default=options.get(CONF_REFRESH_RATE, data.get(CONF_REFRESH_RATE, DEFAULT_REFRESH_RATE)),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=300)),
+                    # Fetch the balance shortly after the meter is expected to report
+                    # instead of at the fixed refresh rate.
+                    vol.Required(
+                        CONF_ADAPTIVE_POLLING,
+                        default=options.get(CONF_ADAPTIVE_POLLING, False),
+                    ): bool,
+                    vol.Required(
+                        CONF_USAGE_REFRESH_RATE,
+                        default=options.get(CONF_USAGE_REFRESH_RATE, DEFAULT_USAGE_REFRESH_RATE),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=300)),
+                    vol.Required(
+                        CONF_TARIFF_REFRESH_RATE,
+                        default=options.get(CONF_TARIFF_REFRESH_RATE, DEFAULT_TARIFF_REFRESH_RATE),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=300)),
+                    # 0 fetches payments only on startup or when a refresh is requested.
+                    vol.Required(
+                        CONF_PAYMENTS_REFRESH_RATE,
+                        default=options.get(CONF_PAYMENTS_REFRESH_RATE, DEFAULT_PAYMENTS_REFRESH_RATE),
+                    ): vol.All(vol.Coerce(int), vol.Any(0, vol.Range(min=300))),
+                    # A usage sensor is created for each window, e.g. "7, 30, 365" days.
+                    vol.Optional(
+                        CONF_USAGE_WINDOWS,
+                        default=options.get(CONF_USAGE_WINDOWS, DEFAULT_USAGE_WINDOWS),
+                    ): vol.All(str, _usage_windows),
+                }
+            ),
         )
\ No newline at end of file
@@ -1,4 +1,18 @@
-DOMAIN = "utilita"
-CONF_EMAIL = "email"
-CONF_PASSWORD = "password"
-CONF_REFRESH_RATE = "refresh_rate"
\ No newline at end of file
+DOMAIN = "utilita"
+DATA_SCHEDULER = f"{DOMAIN}_scheduler"
+# Clients logged in by the config flow, waiting to be picked up by the new entry.
+DATA_PENDING_CLIENTS = f"{DOMAIN}_pending_clients"
+CONF_EMAIL = "email"
+CONF_PASSWORD = "password"
+CONF_REFRESH_RATE = "refresh_rate"
+CONF_ADAPTIVE_POLLING = "adaptive_polling"
+CONF_USAGE_REFRESH_RATE = "usage_refresh_rate"
+CONF_TARIFF_REFRESH_RATE = "tariff_refresh_rate"
+CONF_PAYMENTS_REFRESH_RATE = "payments_refresh_rate"
+CONF_USAGE_WINDOWS = "usage_windows"
+DEFAULT_REFRESH_RATE = 3600
+DEFAULT_USAGE_REFRESH_RATE = 21600
+DEFAULT_TARIFF_REFRESH_RATE = 86400
+DEFAULT_PAYMENTS_REFRESH_RATE = 3600
+DEFAULT_USAGE_WINDOWS = "7, 30"
+STORAGE_VERSION = 1
\ No newline at end of file
@@ -0,0 +1,463 @@
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import issue_registry as ir
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+import aiohttp
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from .adaptive import AdaptivePolling
+from .analytics import build_analytics, parse_windows
+from .api import ENDPOINTS, NOT_MODIFIED, UtilitaClient, UtilitaError, UtilitaSchemaError
+from .backfill import UsageBackfill
+from .history import UsageHistory
+from .ledger import PaymentLedger
+from .models import build_snapshot, changed_contexts, dump_parts, load_parts, parse_endpoint
+from .scheduler import UtilitaScheduler
+from .statistics import UsageStatistics
+from .const import (
+    DOMAIN,
+    CONF_REFRESH_RATE,
+    CONF_ADAPTIVE_POLLING,
+    CONF_USAGE_REFRESH_RATE,
+    CONF_TARIFF_REFRESH_RATE,
+    CONF_PAYMENTS_REFRESH_RATE,
+    CONF_USAGE_WINDOWS,
+    DEFAULT_REFRESH_RATE,
+    DEFAULT_USAGE_REFRESH_RATE,
+    DEFAULT_TARIFF_REFRESH_RATE,
+    DEFAULT_PAYMENTS_REFRESH_RATE,
+    DEFAULT_USAGE_WINDOWS,
+    STORAGE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# An endpoint is treated as due when it is this close to its interval, so a
+# schedule that is a multiple of the balance rate does not slip by a whole tick.
+SCHEDULE_TOLERANCE = 60
+# How long the last good snapshot is served while the portal keeps failing.
+MAX_STALE_AGE = timedelta(hours=24)
+# How far back a usage backfill goes when the supply start date is unknown.
+DEFAULT_BACKFILL_DAYS = 730
+# Refresh requests this close together are fetched together, so automations
+# firing at the same moment log in and fetch once.
+REFRESH_COALESCE_WINDOW = 2
+SNAPSHOT_SAVE_DELAY = 10
+STATUS_CONTEXTS = (("status", None), ("metrics", None))
+
+
+def entry_option(entry, key, default):
+    """Return an option for the entry, falling back to its original data."""
+    return entry.options.get(key, entry.data.get(key, default))
+
+
+class UtilitaCoordinator(DataUpdateCoordinator):
+    """Coordinate Utilita refreshes, fetching each endpoint on its own schedule."""
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, client: UtilitaClient, scheduler: UtilitaScheduler) -> None:
+        self.entry = entry
+        self.client = client
+        self.scheduler = scheduler
+        self.intervals = {}
+        self.adaptive = None
+        self._last_fetched = {}
+        self._parts = dict.fromkeys(ENDPOINTS)
+        self._cookie_store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.session")
+        self._stored_cookies = {}
+        self._snapshot_store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.snapshot")
+        self.history = UsageHistory(hass, entry.entry_id)
+        self.statistics = UsageStatistics(hass, self.history)
+        self.ledger = PaymentLedger(hass, entry.entry_id)
+        self.backfill = UsageBackfill(hass, entry.entry_id, client, self.history)
+        self._backfill_task = None
+        self._requested_endpoints = set()
+        self._pending_refresh = None
+        self._forced_endpoints = set()
+        self._refresh_lock = asyncio.Lock()
+        self.usage_windows = ()
+        self._analytics = {}
+        self.last_success_time = None
+        self.stale_endpoints = set()
+        self._schema_problems = {}
+        self._notified_data = None
+        self._notified_success = None
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"Utilita_{entry.entry_id}",
+            # The snapshot dataclasses compare by value, so listeners and
+            # state writes are skipped when a refresh changed nothing.
+            always_update=False,
+        )
+        self.apply_options()
+
+    def apply_options(self):
+        """Read the per-endpoint refresh rates from the entry options.
+
+        A rate of 0 means the endpoint is only fetched on the first refresh or
+        when explicitly requested.
+        """
+        self.intervals = {
+            "balance": entry_option(self.entry, CONF_REFRESH_RATE, DEFAULT_REFRESH_RATE),
+            "usage": entry_option(self.entry, CONF_USAGE_REFRESH_RATE, DEFAULT_USAGE_REFRESH_RATE),
+            "user_data": entry_option(self.entry, CONF_TARIFF_REFRESH_RATE, DEFAULT_TARIFF_REFRESH_RATE),
+            "payments": entry_option(self.entry, CONF_PAYMENTS_REFRESH_RATE, DEFAULT_PAYMENTS_REFRESH_RATE),
+        }
+        self.adaptive = AdaptivePolling(self.intervals["balance"]) if entry_option(self.entry, CONF_ADAPTIVE_POLLING, False) else None
+        usage_windows = parse_windows(entry_option(self.entry, CONF_USAGE_WINDOWS, DEFAULT_USAGE_WINDOWS))
+        if usage_windows != self.usage_windows:
+            self.usage_windows = usage_windows
+            self._update_analytics()
+        self._apply_intervals()
+        _LOGGER.debug(f"Refresh schedule for entry {self.entry.entry_id}: {self.intervals}, adaptive: {self.adaptive is not None}")
+
+    def _apply_intervals(self):
+        """Schedule the next refresh for when the next endpoint falls due.
+
+        Endpoints never fetched, or whose last fetch failed and are overdue,
+        are tried again after their own interval.
+        """
+        now = time.monotonic()
+        waits = []
+        for key, interval in self.intervals.items():
+            if not interval:
+                continue
+            last = self._last_fetched.get(key)
+            wait = interval if last is None else last + interval - now
+            waits.append(wait if wait > 0 else interval)
+        self.update_interval = timedelta(seconds=min(waits)) if waits else None
+
+    @callback
+    def async_update_listeners(self):
+        """Only wake the entities whose part of the snapshot changed.
+
+        Every listener is still updated when availability changes or there is
+        no previous snapshot to compare against.
+        """
+        previous = self._notified_data
+        self._notified_data = self.data
+        # Entities write their state here, so this times sensor evaluation.
+        with self.client.metrics.timer("listeners"):
+            if (
+                previous is None
+                or self.data is None
+                or self.last_update_success != self._notified_success
+            ):
+                self._notified_success = self.last_update_success
+                super().async_update_listeners()
+                return
+            contexts = changed_contexts(previous, self.data)
+            _LOGGER.debug(f"Updating listeners for entry {self.entry.entry_id}: {contexts}")
+            for update_callback, context in list(self._listeners.values()):
+                if context is None or context in contexts:
+                    update_callback()
+
+    @callback
+    def _async_update_status(self):
+        """Update the entities that report refresh status and metrics, which the snapshot diff does not cover."""
+        for update_callback, context in list(self._listeners.values()):
+            if context in STATUS_CONTEXTS:
+                update_callback()
+
+    @callback
+    def _async_update_schema_issue(self):
+        """Raise one repair issue while any payload is missing expected fields, and remove it once they all match."""
+        problems = self.client.schema.problems
+        if problems == self._schema_problems:
+            return
+        self._schema_problems = dict(problems)
+        issue_id = f"schema_changed_{self.entry.entry_id}"
+        if not problems:
+            ir.async_delete_issue(self.hass, DOMAIN, issue_id)
+            return
+        ir.async_create_issue(
+            self.hass,
+            DOMAIN,
+            issue_id,
+            is_fixable=False,
+            severity=ir.IssueSeverity.WARNING,
+            translation_key="schema_changed",
+            translation_placeholders={
+                "endpoints": ", ".join(sorted(problems)),
+                "problems": "\n".join(f"- {problem}" for _, endpoint_problems in sorted(problems.items()) for problem in endpoint_problems[:5]),
+            },
+        )
+
+    async def async_load_storage(self):
+        """Restore the persisted portal cookies, usage history and payment ledger."""
+        self._stored_cookies = await self._cookie_store.async_load() or {}
+        self.client.import_cookies(self._stored_cookies)
+        await self.history.async_load()
+        await self.ledger.async_load()
+        self._update_analytics()
+
+    def _update_analytics(self):
+        """Recompute the usage analytics from the stored history in one pass per supply."""
+        self._analytics = build_analytics(self.history, self.usage_windows)
+
+    def _build_snapshot(self):
+        return build_snapshot(self._parts, self._analytics)
+
+    async def async_restore_snapshot(self):
+        """Serve the last persisted snapshot straight away, returning whether there was one.
+
+        The fetch times are restored too, so the first live refresh only asks
+        for the endpoints that were already due before the restart.
+        """
+        stored = await self._snapshot_store.async_load()
+        if not stored:
+            return False
+        try:
+            parts = load_parts(stored["parts"])
+            last_success_time = dt_util.parse_datetime(stored["last_success_time"])
+        except (KeyError, TypeError, ValueError, ArithmeticError) as err:
+            _LOGGER.warning(f"Ignoring unreadable snapshot for entry {self.entry.entry_id}: {err}")
+            return False
+        if last_success_time is None or dt_util.utcnow() - last_success_time > MAX_STALE_AGE:
+            return False
+        self._parts.update(parts)
+        if "payments" in stored.get("fetched", {}):
+            self._parts["payments"] = self.ledger.payments
+        now_wall = time.time()
+        now = time.monotonic()
+        for key, fetched in stored.get("fetched", {}).items():
+            if key in self._parts and self._parts[key] is not None:
+                self._last_fetched[key] = now - max(0.0, now_wall - fetched)
+        self.last_success_time = last_success_time
+        self.data = self._build_snapshot()
+        _LOGGER.debug(f"Restored snapshot for entry {self.entry.entry_id} from {last_success_time}")
+        return True
+
+    def _snapshot_to_save(self):
+        now_wall = time.time()
+        now = time.monotonic()
+        return {
+            "parts": dump_parts(self._parts),
+            "last_success_time": self.last_success_time.isoformat(),
+            "fetched": {key: now_wall - (now - fetched) for key, fetched in self._last_fetched.items()},
+        }
+
+    @property
+    def supplies_complete(self):
+        """Whether every endpoint that lists supplies has been parsed, so a missing supply type is really gone."""
+        return all(self._parts[key] is not None for key in ("balance", "usage", "user_data"))
+
+    def request_endpoints(self, endpoints):
+        """Mark endpoints as due so the next refresh fetches them."""
+        self._forced_endpoints.update(endpoints)
+
+    async def async_refresh_endpoints(self, endpoints):
+        """Refresh endpoints on demand, sharing one refresh with every request in the same window.
+
+        The first request opens a window of REFRESH_COALESCE_WINDOW seconds.
+        Requests arriving within it add their endpoints and wait for the same
+        refresh; a request arriving while that refresh is fetching opens the
+        next window, which starts fetching once the current one is done.
+        """
+        self._requested_endpoints.update(endpoints)
+        if self._pending_refresh is None:
+            self._pending_refresh = self.entry.async_create_background_task(
+                self.hass, self._async_requested_refresh(), f"utilita_refresh_{self.entry.entry_id}"
+            )
+        # One caller giving up must not cancel the refresh the others wait for.
+        await asyncio.shield(self._pending_refresh)
+
+    async def _async_requested_refresh(self):
+        await asyncio.sleep(REFRESH_COALESCE_WINDOW)
+        self._pending_refresh = None
+        endpoints, self._requested_endpoints = self._requested_endpoints, set()
+        _LOGGER.debug(f"Refreshing {sorted(endpoints)} on request for entry {self.entry.entry_id}")
+        self.request_endpoints(endpoints)
+        await self.async_refresh()
+
+    def _due_endpoints(self):
+        # Applied here, under the refresh lock, so a refresh already fetching cannot mark them fresh again.
+        for key in self._forced_endpoints:
+            self._last_fetched.pop(key, None)
+        self._forced_endpoints.clear()
+        now = time.monotonic()
+        due = []
+        for key in ENDPOINTS:
+            last = self._last_fetched.get(key)
+            interval = self.intervals.get(key)
+            if last is None or (interval and now - last + SCHEDULE_TOLERANCE >= interval):
+                due.append(key)
+        if "usage" in due and "usage" in self._last_fetched and self._usage_up_to_date():
+            due.remove("usage")
+        return due
+
+    def _usage_up_to_date(self):
+        """Whether every supply already has a stored row for yesterday.
+
+        The usage endpoint only takes an end date and always returns the same
+        window, so the closest thing to a delta fetch is not asking again until
+        a newer day can exist.
+        """
+        last_date = self.history.last_date()
+        return last_date is not None and last_date[:10] >= (date.today() - timedelta(days=1)).isoformat()
+
+    async def _async_update_data(self):
+        """Fetch the endpoints that are due from Utilita and rebuild the sensor snapshot.
+
+        Scheduled, startup and requested refreshes all come through here, and
+        only one fetches at a time; the next one then sees what it fetched.
+        """
+        async with self._refresh_lock:
+            return await self._async_update_due()
+
+    async def _async_update_due(self):
+        due = self._due_endpoints()
+        _LOGGER.debug(f"Starting data update for entry {self.entry.entry_id}, due endpoints: {due}")
+        if not due:
+            self._apply_intervals()
+            return self.data
+        await self.scheduler.async_wait_turn()
+        try:
+            with self.client.metrics.timer("refresh"):
+                return await self._async_fetch_due(due)
+        finally:
+            # The coordinator schedules its next refresh from update_interval once this returns.
+            self._apply_intervals()
+            self._async_update_status()
+            self._async_update_schema_issue()
+
+    async def _async_fetch_due(self, due):
+        """Fetch the due endpoints and return the new snapshot, or the current one if nothing changed.
+
+        Each part is published as soon as it arrives, so a slow or retrying
+        endpoint does not hold back fresh data from the others.
+        """
+        tasks = {asyncio.create_task(self._async_fetch_part(key)): key for key in due}
+        failed = []
+        changed = []
+        errors = []
+        published = 0
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key = tasks[task]
+                    error = task.exception()
+                    if error is not None:
+                        if not isinstance(error, UtilitaSchemaError):
+                            # Payload problems are logged by the client, rate limited.
+                            _LOGGER.warning(f"Error fetching {key} for entry {self.entry.entry_id}: {error}")
+                        failed.append(key)
+                        errors.append(error)
+                        self.stale_endpoints.add(key)
+                        continue
+                    self._last_fetched[key] = time.monotonic()
+                    self.stale_endpoints.discard(key)
+                    if task.result() != self._parts[key]:
+                        self._parts[key] = task.result()
+                        changed.append(key)
+                if len(changed) > published and pending and self.data is not None:
+                    published = len(changed)
+                    self.data = self._build_snapshot()
+                    self.async_update_listeners()
+        finally:
+            for task in tasks:
+                task.cancel()
+        if len(failed) == len(due):
+            if self.data is not None and dt_util.utcnow() - self.last_success_time < MAX_STALE_AGE:
+                _LOGGER.warning(f"All endpoints failed for entry {self.entry.entry_id}, serving data from {self.last_success_time}")
+                return self.data
+            _LOGGER.error(f"Error fetching data for entry {self.entry.entry_id}: all endpoints failed")
+            raise UpdateFailed(f"Error fetching data: {errors[0]}")
+        self.last_success_time = dt_util.utcnow()
+        self._snapshot_store.async_delay_save(self._snapshot_to_save, SNAPSHOT_SAVE_DELAY)
+        await self._async_save_session()
+        _LOGGER.debug(f"Data update completed for entry {self.entry.entry_id}, changed: {changed}, failed: {failed}")
+        if self.adaptive is not None and "balance" in due and "balance" not in failed:
+            # Schedule the next balance fetch for shortly after the meter is expected to report.
+            self.intervals["balance"] = self.adaptive.next_interval(self._parts["balance"] or {})
+        if not changed and self.data is not None and self.data.analytics is self._analytics:
+            return self.data
+        return self._build_snapshot()
+
+    async def _async_fetch_part(self, key):
+        """Fetch one endpoint and return its parsed form."""
+        if key == "payments":
+            return await self.ledger.async_sync(self.client)
+        payload = await self.client.async_get_endpoint(key)
+        if payload is NOT_MODIFIED:
+            return self._parts[key]
+        if key == "usage":
+            self._merge_history(payload)
+        with self.client.metrics.timer(key, "parse"):
+            parsed = parse_endpoint(key, payload)
+        if parsed is None:
+            # Keep the last good part, mark it stale and parse the payload again next time.
+            self.client.forget_payload(key)
+            raise UtilitaSchemaError(f"Could not parse the {key} payload")
+        return parsed
+
+    def _merge_history(self, payload):
+        try:
+            changed, earliest = self.history.merge(payload)
+        except (KeyError, TypeError, AttributeError) as err:
+            _LOGGER.error(f"Error storing usage history: {err}")
+            return
+        _LOGGER.debug(f"Stored {changed} new or changed usage rows for entry {self.entry.entry_id}")
+        if changed:
+            self._update_analytics()
+        # Revised rows, such as a partial day completed later, are imported again from the earliest one.
+        self.entry.async_create_background_task(
+            self.hass, self.statistics.async_import(since=earliest), f"utilita_statistics_{self.entry.entry_id}"
+        )
+
+    def _supply_start_date(self):
+        """Return the earliest supply start date from the tariff details, if known."""
+        user_data = self._parts["user_data"]
+        dates = [
+            dt_util.parse_date(str(tariff.attributes.get("supply_start_date"))[:10])
+            for tariff in (user_data.tariff.values() if user_data else ())
+            if tariff.attributes.get("supply_start_date")
+        ]
+        dates = [start for start in dates if start is not None]
+        return min(dates) if dates else None
+
+    @callback
+    def async_start_backfill(self, start=None, end=None):
+        """Start a usage backfill in the background, returning False if one is already running."""
+        if self._backfill_task is not None and not self._backfill_task.done():
+            return False
+        self._backfill_task = self.entry.async_create_background_task(
+            self.hass, self._async_backfill(start, end), f"utilita_backfill_{self.entry.entry_id}"
+        )
+        return True
+
+    async def _async_backfill(self, start=None, end=None):
+        if end is None:
+            # Without an end date, carry on with an interrupted backfill even if it was started on another day.
+            unfinished = await self.backfill.async_unfinished_range()
+            if unfinished is not None and start in (None, unfinished[0]):
+                start, end = unfinished
+        end = end or date.today()
+        start = start or self._supply_start_date() or end - timedelta(days=DEFAULT_BACKFILL_DAYS)
+        try:
+            result = await self.backfill.async_run(start, end)
+        except (UtilitaError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.error(f"Usage backfill from {start} to {end} failed for entry {self.entry.entry_id}: {err}")
+            return None
+        if result["changed_rows"]:
+            self._update_analytics()
+            # Backfilled rows are older than the last imported day, so the running sums are rebuilt from there.
+            self.entry.async_create_background_task(
+                self.hass,
+                self.statistics.async_import(since=result["earliest_changed"]),
+                f"utilita_statistics_{self.entry.entry_id}",
+            )
+            self.async_set_updated_data(self._build_snapshot())
+        return result
+
+    async def _async_save_session(self):
+        cookies = self.client.export_cookies()
+        if cookies != self._stored_cookies:
+            self._stored_cookies = cookies
+            await self._cookie_store.async_save(cookies)
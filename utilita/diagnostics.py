@@ -0,0 +1,26 @@
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN, CONF_EMAIL, CONF_PASSWORD
+
+TO_REDACT = {CONF_EMAIL, CONF_PASSWORD}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Return the refresh state and performance metrics of a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "refresh": {
+            "intervals": coordinator.intervals,
+            "adaptive_polling": coordinator.adaptive is not None,
+            "last_update_success": coordinator.last_update_success,
+            "last_success_time": coordinator.last_success_time,
+            "stale_endpoints": sorted(coordinator.stale_endpoints),
+            "requests_paused": coordinator.client.breaker.is_open,
+        },
+        "metrics": coordinator.client.metrics.as_dict(),
+    }
@@ -0,0 +1,26 @@
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from .const import DOMAIN
+
+class UtilitaEntity(CoordinatorEntity):
+    """Base for Utilita entities, woken only when their part of the snapshot changes.
+
+    The coordinator context is the (domain, supply type) pair the entity reads,
+    matching the keys returned by models.changed_contexts.
+    """
+
+    def __init__(self, coordinator, entry_id, domain, supply_type=None):
+        super().__init__(coordinator, (domain, supply_type))
+        self._entry_id = entry_id
+        self._supply_type = supply_type
+        self._attr_device_info = DeviceInfo(
+            entry_type=DeviceEntryType.SERVICE,
+            identifiers={(DOMAIN, f"utilita_{entry_id}")},
+            name="Utilita Energy",
+            manufacturer="Utilita",
+            model="Energy Monitor",
+        )
+
+    @property
+    def available(self):
+        return self.coordinator.last_update_success
\ No newline at end of file
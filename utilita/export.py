@@ -0,0 +1,163 @@
+import csv
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_DATA = ("usage", "payments")
+USAGE_FIELDS = ("supply_id", "supply_type", "date", "kwh", "pence", "avg_temperature_c")
+PAYMENT_FIELDS = (
+    "date",
+    "type",
+    "metercreditamount",
+    "debtdeducted",
+    "debtrecoveryrate",
+    "transactionamount",
+    "full_description",
+)
+# One header for both kinds of record, so a single CSV can hold usage and payments.
+CSV_FIELDS = ("record",) + tuple(dict.fromkeys(USAGE_FIELDS + PAYMENT_FIELDS))
+
+
+def iter_usage(history, start=None, end=None):
+    """Return an iterator over the stored daily usage of every supply as export records, one supply after the other.
+
+    The supplies and their dates are read when this is called, on the event
+    loop, so the iterator can be consumed in an executor while refreshes
+    merge new rows into the history.
+    """
+    supplies = [
+        (supply_id, supply_type, history.dates(supply_id, start, end))
+        for supply_id, supply_type in history.supplies.items()
+    ]
+    return _usage_records(history, supplies)
+
+
+def _usage_records(history, supplies):
+    for supply_id, supply_type, dates in supplies:
+        for day in dates:
+            yield {"record": "usage", "supply_id": supply_id, "supply_type": supply_type, **history.row(supply_id, day)}
+
+
+def iter_payments(ledger, start=None, end=None):
+    """Return an iterator over the stored payments as export records, oldest first."""
+    return _payment_records(ledger.iter_payments(start, end))
+
+
+def _payment_records(payments):
+    for payment in payments:
+        record = {"record": "payment", "date": payment["issuetime"]}
+        record.update((field, payment.get(field)) for field in PAYMENT_FIELDS[1:])
+        if record["full_description"]:
+            record["full_description"] = record["full_description"].strip()
+        yield record
+
+
+class ExportSummary:
+    """Totals of the records passing through an export, built as they stream past."""
+
+    def __init__(self):
+        self.records = 0
+        self._usage = {}
+        self._payments = {"count": 0, "credit": 0.0, "transactions": 0.0, "first_date": None, "last_date": None}
+
+    def track(self, records):
+        """Pass the records through unchanged while adding them to the totals."""
+        for record in records:
+            self.records += 1
+            if record["record"] == "usage":
+                self._add_usage(record)
+            else:
+                self._add_payment(record)
+            yield record
+
+    def _add_usage(self, record):
+        supply = self._usage.get(record["supply_id"])
+        if supply is None:
+            supply = self._usage[record["supply_id"]] = {
+                "supply_type": record["supply_type"],
+                "days": 0,
+                "kwh": 0.0,
+                "pence": 0.0,
+                "first_date": record["date"],
+                "last_date": None,
+            }
+        supply["days"] += 1
+        supply["kwh"] += float(record["kwh"] or 0)
+        supply["pence"] += float(record["pence"] or 0)
+        supply["last_date"] = record["date"]
+
+    def _add_payment(self, record):
+        payments = self._payments
+        payments["count"] += 1
+        payments["credit"] += float(record["metercreditamount"] or 0)
+        payments["transactions"] += float(record["transactionamount"] or 0)
+        payments["first_date"] = payments["first_date"] or record["date"][:10]
+        payments["last_date"] = record["date"][:10]
+
+    def as_dict(self):
+        """Return the totals with kWh rounded and money in GBP, as a service response."""
+        usage = {
+            supply_id: {
+                "supply_type": supply["supply_type"],
+                "days": supply["days"],
+                "kwh": round(supply["kwh"], 3),
+                "cost": round(supply["pence"] / 100, 2),
+                "first_date": supply["first_date"],
+                "last_date": supply["last_date"],
+            }
+            for supply_id, supply in self._usage.items()
+        }
+        payments = self._payments
+        return {
+            "records": self.records,
+            "usage": usage,
+            "payments": {
+                "count": payments["count"],
+                "credit": round(payments["credit"] / 100, 2),
+                "transactions": round(payments["transactions"] / 100, 2),
+                "first_date": payments["first_date"],
+                "last_date": payments["last_date"],
+            },
+        }
+
+
+def _write_csv(file, records):
+    writer = csv.DictWriter(file, CSV_FIELDS, restval="", extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+
+
+def _write_jsonl(file, records):
+    for record in records:
+        file.write(json.dumps(record, separators=(",", ":")))
+        file.write("\n")
+
+
+WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl}
+
+
+def write_export(path, records, export_format):
+    """Stream records to a file, one at a time, replacing the file only once every record is written.
+
+    Blocking; run it in an executor.
+    """
+    partial = f"{path}.partial"
+    try:
+        with open(partial, "w", encoding="utf-8", newline="") as file:
+            WRITERS[export_format](file, records)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    _LOGGER.debug(f"Exported Utilita history to {path}")
+
+
+def consume(records):
+    """Run records through without writing them, for a summary without a file."""
+    for _ in records:
+        pass
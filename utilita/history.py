@@ -0,0 +1,74 @@
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+import logging
+from .const import DOMAIN, STORAGE_VERSION
+
+_LOGGER = logging.getLogger(__name__)
+
+SAVE_DELAY = 30
+
+
+class UsageHistory:
+    """Daily usage rows of every supply, persisted per config entry and keyed by date."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}.usage_history")
+        self._supplies = {}
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        self._supplies = data.get("supplies", {})
+        _LOGGER.debug(f"Loaded usage history for {len(self._supplies)} supplies, last date {self.last_date()}")
+
+    def _data_to_save(self):
+        return {"supplies": self._supplies}
+
+    @property
+    def supplies(self):
+        """Map of supply id to its supply type."""
+        return {supply_id: supply["type"] for supply_id, supply in self._supplies.items()}
+
+    def merge(self, payload):
+        """Merge the rows of a usage payload into the history.
+
+        Return how many rows were new or changed, and the earliest date among
+        them (None if nothing changed).
+        """
+        changed = 0
+        earliest = None
+        for supply in payload["data"]["data"]:
+            stored = self._supplies.setdefault(supply.get("supply_id"), {"type": supply.get("type"), "days": {}})
+            days = stored["days"]
+            for row in supply.get("usage") or []:
+                record = {
+                    "kwh": row.get("kwh"),
+                    "pence": row.get("pence"),
+                    "avg_temperature_c": row.get("avg_temperature_c"),
+                }
+                if days.get(row["date"]) != record:
+                    days[row["date"]] = record
+                    changed += 1
+                    if earliest is None or row["date"][:10] < earliest:
+                        earliest = row["date"][:10]
+        if changed:
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+        return changed, earliest
+
+    def last_date(self, supply_id=None):
+        """Return the most recent stored date of a supply, or the oldest such date across all supplies."""
+        supplies = [self._supplies[supply_id]] if supply_id in self._supplies else [] if supply_id else self._supplies.values()
+        dates = [max(supply["days"]) for supply in supplies if supply["days"]]
+        return min(dates) if dates else None
+
+    def dates(self, supply_id, start=None, end=None):
+        """Return the stored dates of a supply between two ISO dates (inclusive), oldest first."""
+        days = self._supplies.get(supply_id, {}).get("days", {})
+        return [day for day in sorted(days) if (start is None or day >= start) and (end is None or day <= end)]
+
+    def row(self, supply_id, day):
+        """Return the stored row of a supply for one date."""
+        return {"date": day, **self._supplies[supply_id]["days"][day]}
+
+    def rows(self, supply_id, start=None, end=None):
+        """Return the stored rows of a supply between two ISO dates (inclusive), oldest first."""
+        return [self.row(supply_id, day) for day in self.dates(supply_id, start, end)]
@@ -0,0 +1,116 @@
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+import logging
+from .api import PAYMENTS_PATH
+from .const import DOMAIN, STORAGE_VERSION
+from .models import Payments, payment_details
+
+_LOGGER = logging.getLogger(__name__)
+
+SAVE_DELAY = 30
+HISTORY_PAGE_SIZE = 50
+SYNC_PAGE_SIZE = 10
+MAX_PAGES = 100
+# The payments sensor shows the same number of payments as the single page it used to fetch.
+RECENT_PAYMENTS = 50
+PAYMENT_FIELDS = (
+    "type",
+    "metercreditamount",
+    "debtdeducted",
+    "debtrecoveryrate",
+    "transactionamount",
+    "full_description",
+    "issuetime",
+)
+
+
+def _payment_key(payment):
+    return (payment["issuetime"], payment["type"], payment["transactionamount"], payment["metercreditamount"])
+
+
+def _payments_between(payments, start, end):
+    for payment in reversed(payments):
+        day = payment["issuetime"][:10]
+        if end is not None and day > end:
+            break
+        if start is None or day >= start:
+            yield payment
+
+
+class PaymentLedger:
+    """Every payment on the account, persisted per config entry, newest first."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}.payments")
+        self._payments = []
+        self._keys = set()
+        self._complete = False
+        self._recent = []
+        self.payments = None
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        self._payments = data.get("payments", [])
+        self._keys = {_payment_key(payment) for payment in self._payments}
+        self._complete = data.get("complete", False)
+        self._recent = [payment_details(payment) for payment in self._payments[:RECENT_PAYMENTS]]
+        self._update_grouped()
+        _LOGGER.debug(f"Loaded {len(self._payments)} payments, history complete: {self._complete}")
+
+    def _data_to_save(self):
+        return {"payments": self._payments, "complete": self._complete}
+
+    def _update_grouped(self):
+        grouped_payments = {}
+        for details in self._recent:
+            grouped_payments.setdefault(details["issuetime"].split("T")[0], []).append(details)
+        self.payments = Payments(state=len(self._recent), attributes=grouped_payments)
+
+    async def async_sync(self, client):
+        """Fetch payments not yet in the ledger and return the recent payments.
+
+        The first sync pages back through the whole history. Later syncs use
+        small pages and stop at the first page that reaches a payment already
+        in the ledger.
+        """
+        per_page = SYNC_PAGE_SIZE if self._complete else HISTORY_PAGE_SIZE
+        new = []
+        seen = set(self._keys)
+        for page in range(1, MAX_PAGES + 1):
+            payload = await client.async_get_json(PAYMENTS_PATH.format(page=page, per_page=per_page))
+            records = payload["payments"]
+            fresh = [payment for payment in records if _payment_key(payment) not in seen]
+            seen.update(_payment_key(payment) for payment in fresh)
+            new.extend({field: payment.get(field) for field in PAYMENT_FIELDS} for payment in fresh)
+            if len(records) < per_page or (self._complete and len(fresh) < len(records)):
+                break
+        if new or not self._complete:
+            self._add(new)
+        return self.payments
+
+    def iter_payments(self, start=None, end=None):
+        """Return an iterator over the stored payments issued between two ISO dates (inclusive), oldest first.
+
+        _add replaces the list rather than changing it, so the iterator can be
+        consumed in an executor while a sync runs.
+        """
+        return _payments_between(self._payments, start, end)
+
+    def _add(self, new):
+        """Merge newly fetched payments, formatting only the new ones."""
+        new.sort(key=lambda payment: payment["issuetime"], reverse=True)
+        if new and self._payments and new[-1]["issuetime"] < self._payments[0]["issuetime"]:
+            # Older payments found while backfilling; keep the ledger in order.
+            payments = sorted(self._payments + new, key=lambda payment: payment["issuetime"], reverse=True)
+            recent = [payment_details(payment) for payment in payments[:RECENT_PAYMENTS]]
+        else:
+            payments = new + self._payments
+            recent = ([payment_details(payment) for payment in new] + self._recent)[:RECENT_PAYMENTS]
+        # Only keep the payments once they all formatted, so a failing one is fetched again.
+        self._keys.update(_payment_key(payment) for payment in new)
+        self._payments = payments
+        self._recent = recent
+        self._complete = True
+        self._update_grouped()
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+        _LOGGER.debug(f"Added {len(new)} payments to the ledger, {len(self._payments)} in total")
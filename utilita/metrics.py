@@ -0,0 +1,97 @@
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+
+# Samples kept per measurement; percentiles cover roughly the last day of refreshes.
+SAMPLE_SIZE = 128
+
+
+class RingBuffer:
+    """The most recent samples of one measurement, overwriting the oldest."""
+
+    __slots__ = ("_values", "_index", "_count")
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self._values = array("d", bytes(8 * size))
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        self._count = min(self._count + 1, len(self._values))
+
+    def summary(self, scale=1):
+        """Return the median, 95th percentile and maximum of the samples, or None if there are none."""
+        if not self._count:
+            return None
+        ordered = sorted(self._values[:self._count])
+        return {
+            "p50": round(ordered[(self._count - 1) // 2] * scale, 3),
+            "p95": round(ordered[min(self._count - 1, self._count * 95 // 100)] * scale, 3),
+            "max": round(ordered[-1] * scale, 3),
+            "samples": self._count,
+        }
+
+
+class StageMetrics:
+    """Rolling timings and counters of one endpoint or refresh stage."""
+
+    __slots__ = ("latency", "size", "decode", "validate", "parse", "counters")
+
+    def __init__(self):
+        self.latency = RingBuffer()
+        self.size = RingBuffer()
+        self.decode = RingBuffer()
+        self.validate = RingBuffer()
+        self.parse = RingBuffer()
+        self.counters = Counter()
+
+    def as_dict(self):
+        requests = self.counters["requests"]
+        data = {
+            "latency_ms": self.latency.summary(1000),
+            "payload_bytes": self.size.summary(),
+            "decode_ms": self.decode.summary(1000),
+            "validate_ms": self.validate.summary(1000),
+            "parse_ms": self.parse.summary(1000),
+            **self.counters,
+        }
+        if requests:
+            data["cache_hit_rate"] = round(self.counters["not_modified"] / requests, 3)
+        return {key: value for key, value in data.items() if value is not None}
+
+
+class UtilitaMetrics:
+    """Per-endpoint and per-stage performance metrics of one client.
+
+    Endpoints are keyed like ENDPOINTS; login, csrf, refresh and listeners
+    time the other stages of a refresh.
+    """
+
+    def __init__(self):
+        self._stages = {}
+
+    def stage(self, name):
+        if name not in self._stages:
+            self._stages[name] = StageMetrics()
+        return self._stages[name]
+
+    def count(self, name, counter):
+        self.stage(name).counters[counter] += 1
+
+    @contextmanager
+    def timer(self, name, measurement="latency"):
+        """Time the block into a measurement of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            getattr(self.stage(name), measurement).append(time.perf_counter() - start)
+
+    def as_dict(self):
+        return {name: stage.as_dict() for name, stage in sorted(self._stages.items())}
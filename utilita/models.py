@@ -0,0 +1,354 @@
+import logging
+import re
+from dataclasses import dataclass, field, fields, is_dataclass, replace
+from decimal import Decimal, ROUND_HALF_UP
+
+_LOGGER = logging.getLogger(__name__)
+
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+FIRST_RATE_RE = re.compile(r"First (\d+\.?\d*) kWh", re.IGNORECASE)
+USAGE_PERIODS = ("daily", "weekly", "monthly", "yearly")
+
+def strip_html(text):
+    """Remove HTML tags and normalize whitespace."""
+    if not text:
+        return ""
+    text = HTML_TAG_RE.sub("", text)
+    return text.replace("\xa0", " ").strip()
+
+def format_amount(pence):
+    """Convert pence to formatted pounds with commas and pound sign."""
+    pounds = Decimal(pence) / Decimal('100')
+    return f"£{pounds.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP):,.2f}"
+
+def quantize(value, places):
+    """Round a Decimal half up to the given exponent and return it as a float."""
+    return float(value.quantize(Decimal(places), rounding=ROUND_HALF_UP))
+
+@dataclass(slots=True)
+class Account:
+    """Customer details from user-data."""
+
+    state: str | None
+    attributes: dict
+
+@dataclass(slots=True)
+class BalanceSupply:
+    """Balance of one supply, ready for the balance sensor."""
+
+    state: float | None
+    attributes: dict
+
+@dataclass(slots=True)
+class UsageSupply:
+    """Usage of one supply with the state and attributes of every period."""
+
+    supply_id: str | None
+    daily_kwh: Decimal
+    is_smart_meter: bool | None
+    smets: str | None
+    states: dict
+    attributes: dict
+
+@dataclass(slots=True)
+class TariffSupply:
+    """Tariff of one supply, including the parsed tier rates."""
+
+    span: str | None
+    meter_units: str | None
+    state: str | None
+    attributes: dict
+    description: str
+    first_rate_kwh: Decimal
+    rate1: Decimal
+    rate2: Decimal
+
+@dataclass(slots=True)
+class UserData:
+    """Account and tariffs parsed from user-data."""
+
+    account: Account
+    tariff: dict
+
+@dataclass(slots=True)
+class CurrentRate:
+    """Rate currently charged for one supply based on the daily usage."""
+
+    state: str | None
+    attributes: dict
+
+@dataclass(slots=True)
+class Payments:
+    """Most recent payments grouped by date."""
+
+    state: int
+    attributes: dict
+
+@dataclass(slots=True)
+class UtilitaSnapshot:
+    """Everything the sensors show, indexed by supply type."""
+
+    account: Account | None = None
+    balance: dict = field(default_factory=dict)
+    usage: dict = field(default_factory=dict)
+    tariff: dict = field(default_factory=dict)
+    current_rate: dict = field(default_factory=dict)
+    payments: Payments | None = None
+    analytics: dict = field(default_factory=dict)
+
+def _parse_account(user_data):
+    premises = user_data.get("premises", [])
+    attributes = {}
+    if premises:
+        attributes = {
+            "address": premises[0].get("addr_full"),
+            "premises_id": str(premises[0].get("premises_id", "")).replace(",", ""),
+        }
+    else:
+        _LOGGER.warning("No premises found in user_data")
+    return Account(state=user_data.get("customer_id"), attributes=attributes)
+
+def _parse_balance_supply(supply):
+    balance = supply["balance"]
+    return BalanceSupply(
+        state=quantize(Decimal(str(balance["money"])) / Decimal('100'), '0.01'),
+        attributes={
+            "supply_id": supply.get("supply_id"),
+            "payment_mode": supply.get("payment_mode"),
+            "zero_time": balance.get("zero_time"),
+            "duration_remaining": strip_html(balance.get("duration")),
+            "updated": balance.get("updated"),
+            "emergency_credit_status": supply["emergency_credit"].get("status", "Unknown"),
+            "debt_money": supply["debt"].get("money", 0),
+            "debt_recovery_rate": supply["debt"].get("debt_recovery_rate", 0),
+            "messages": [msg["text"] for msg in balance.get("messages") or []],
+        },
+    )
+
+def _usage_row(row):
+    return {
+        "date": row.get("date"),
+        "kwh": quantize(Decimal(str(row["kwh"])), '0.001'),
+        "pence": row.get("pence"),
+        "avg_temp": f"{row.get('avg_temperature_c')}°C",
+    }
+
+def _parse_usage_supply(supply):
+    """Parse one usage supply, keeping only the last week of rows the sensors show."""
+    rows = supply.get("usage") or []
+    week = [_usage_row(row) for row in rows[-7:]]
+    if week:
+        last = week[-1]
+        daily_attributes = {"last_updated": last["date"], "kwh": last["kwh"], "pence": last["pence"], "avg_temp": last["avg_temp"]}
+    else:
+        daily_attributes = {"last_updated": None, "kwh": None, "pence": None, "avg_temp": None}
+    weekly_cost = sum(Decimal(str(row.get("pence") or 0)) for row in rows[-7:])
+    monthly_attributes = {}
+    if supply.get("monthly_cost") is not None:
+        monthly_attributes["monthly_cost"] = format_amount(supply["monthly_cost"])
+    yearly_attributes = {}
+    if supply.get("yearly_cost") is not None:
+        yearly_attributes["yearly_cost"] = format_amount(supply["yearly_cost"])
+    daily_kwh = Decimal(str(rows[-1]["kwh"])) if rows else Decimal('0')
+    return UsageSupply(
+        supply_id=supply.get("supply_id"),
+        daily_kwh=daily_kwh,
+        is_smart_meter=supply.get("is_smart_meter"),
+        smets=supply.get("smets"),
+        states={
+            "daily": quantize(daily_kwh, '0.001') if rows else None,
+            "weekly": quantize(sum(Decimal(str(row["kwh"])) for row in rows[-7:]), '0.001'),
+            "monthly": quantize(Decimal(str(supply["monthly_kwh"])), '0.001'),
+            "yearly": quantize(Decimal(str(supply["yearly_kwh"])), '0.001'),
+        },
+        attributes={
+            "daily": daily_attributes,
+            "weekly": {"weekly_usage": week, "weekly_cost": format_amount(weekly_cost)},
+            "monthly": monthly_attributes,
+            "yearly": yearly_attributes,
+        },
+    )
+
+def _parse_tariff_supply(supply):
+    description = strip_html(supply.get("tariff_description", ""))
+    match = FIRST_RATE_RE.search(description)
+    meter = supply.get("meter") or {}
+    attributes = {
+        "region_name": supply.get("region_name"),
+        "first_rate_kwh": float(match.group(1)) if match else None,
+        "rate1": f"{round(float(supply['rate1']), 2)}p" if supply.get("rate1") else None,
+        "rate2": f"{round(float(supply['rate2']), 2)}p" if supply.get("rate2") else None,
+        "span": supply.get("span"),
+        "pan": supply.get("pan"),
+        "meter_id": meter.get("id"),
+        "meter_units": meter.get("units"),
+        "supply_start_date": supply.get("supply_start_date"),
+    }
+    if supply.get("type") == "elec":
+        mpan = supply.get("mpan") or {}
+        top_line = mpan.get("top_line") or {}
+        core = mpan.get("core") or {}
+        attributes["mpan"] = f"{top_line.get('pc', '')} {top_line.get('mtc', '')} {top_line.get('llfc', '')} {core.get('did', '')} {core.get('ui', '')} {core.get('cd', '')}".strip()
+    return TariffSupply(
+        span=supply.get("span"),
+        meter_units=meter.get("units"),
+        state=supply.get("tariff_name"),
+        attributes=attributes,
+        description=description,
+        first_rate_kwh=Decimal(match.group(1)) if match else Decimal('0'),
+        rate1=Decimal(str(supply.get("rate1") or 0)),
+        rate2=Decimal(str(supply.get("rate2") or 0)),
+    )
+
+def _current_rate(tariff, usage_supply):
+    daily_kwh = usage_supply.daily_kwh if usage_supply is not None else Decimal('0')
+    rate = tariff.rate1 if daily_kwh <= tariff.first_rate_kwh else tariff.rate2
+    return CurrentRate(
+        state=f"{quantize(rate, '0.01')}p",
+        attributes={
+            "daily_usage_kwh": quantize(daily_kwh, '0.001'),
+            "first_rate_kwh": float(tariff.first_rate_kwh),
+            "rate1": f"{quantize(tariff.rate1, '0.01')}p" if tariff.rate1 else None,
+            "rate2": f"{quantize(tariff.rate2, '0.01')}p" if tariff.rate2 else None,
+        },
+    )
+
+def parse_balance(payload):
+    """Return the balance of each supply type."""
+    balance = {}
+    for supply in payload["data"]["supplies"]:
+        if supply.get("type") not in balance:
+            balance[supply.get("type")] = _parse_balance_supply(supply)
+    return balance
+
+def parse_usage(payload):
+    """Return the usage of each supply keyed by supply id (span), with its type."""
+    usage = {}
+    for supply in payload["data"]["data"]:
+        if supply.get("supply_id") not in usage:
+            usage[supply.get("supply_id")] = (supply.get("type"), _parse_usage_supply(supply))
+    return usage
+
+def parse_user_data(payload):
+    """Return the account and the tariff of each supply type."""
+    premises = payload.get("premises") or [{}]
+    tariff = {}
+    for supply in premises[0].get("supplies", []):
+        if supply.get("type") not in tariff:
+            tariff[supply.get("type")] = _parse_tariff_supply(supply)
+    return UserData(account=_parse_account(payload), tariff=tariff)
+
+def payment_details(payment):
+    """Format one payment for the payments sensor attributes."""
+    return {
+        "type": payment["type"],
+        "amount": format_amount(payment["metercreditamount"]),
+        # The ledger stores missing fields as None.
+        "debt_deducted": format_amount(payment.get("debtdeducted") or 0),
+        "debt_recovery_rate": payment.get("debtrecoveryrate") or 0,
+        "transaction_amount": format_amount(payment["transactionamount"]),
+        "full_description": payment["full_description"].strip(),
+        "issuetime": payment["issuetime"],
+    }
+
+PARSERS = {
+    "balance": parse_balance,
+    "usage": parse_usage,
+    "user_data": parse_user_data,
+}
+
+def parse_endpoint(key, payload):
+    """Parse one endpoint payload into its compact form, or None if it cannot be parsed.
+
+    Only the parsed form is kept, so the decoded JSON can be released as soon
+    as this returns.
+    """
+    try:
+        return PARSERS[key](payload)
+    except (KeyError, TypeError, IndexError, ValueError, ArithmeticError, AttributeError) as err:
+        _LOGGER.error(f"Error parsing {key}: {err}")
+        return None
+
+def build_snapshot(parts, analytics=None):
+    """Combine the parsed endpoints and the usage history analytics into the values every sensor reads."""
+    snapshot = UtilitaSnapshot(balance=parts.get("balance") or {}, analytics=analytics or {})
+    user_data = parts.get("user_data")
+    tariffs = user_data.tariff if user_data else {}
+    meter_units_by_span = {tariff.span: tariff.meter_units for tariff in tariffs.values()}
+    usage_by_span = {}
+    for supply_id, (supply_type, usage) in (parts.get("usage") or {}).items():
+        base = {"supply_id": supply_id}
+        if meter_units_by_span.get(supply_id) is not None:
+            base["meter_units"] = meter_units_by_span[supply_id]
+        usage = replace(usage, attributes={period: {**base, **attrs} for period, attrs in usage.attributes.items()})
+        snapshot.usage.setdefault(supply_type, usage)
+        usage_by_span[supply_id] = usage
+    if user_data:
+        snapshot.account = user_data.account
+        for supply_type, tariff in tariffs.items():
+            attributes = dict(tariff.attributes)
+            usage = usage_by_span.get(tariff.span)
+            if usage is not None:
+                attributes["is_smart_meter"] = usage.is_smart_meter
+                attributes["smets"] = usage.smets
+            elif parts.get("usage") is not None:
+                _LOGGER.warning(f"No matching usage data found for supply {tariff.span}")
+            attributes["tariff_description"] = tariff.description
+            snapshot.tariff[supply_type] = replace(tariff, attributes=attributes)
+            snapshot.current_rate[supply_type] = _current_rate(tariff, snapshot.usage.get(supply_type))
+    snapshot.payments = parts.get("payments")
+    return snapshot
+
+def supply_types(snapshot):
+    """Return the supply types found in the balance, usage or tariff data."""
+    return (snapshot.balance.keys() | snapshot.usage.keys() | snapshot.tariff.keys()) - {None}
+
+def changed_contexts(old, new):
+    """Return the (domain, supply type) pairs whose values differ between two snapshots."""
+    changed = set()
+    if old.account != new.account:
+        changed.add(("account", None))
+    for domain in ("balance", "usage", "tariff", "current_rate", "analytics"):
+        old_values = getattr(old, domain)
+        new_values = getattr(new, domain)
+        for supply_type in old_values.keys() | new_values.keys():
+            if old_values.get(supply_type) != new_values.get(supply_type):
+                changed.add((domain, supply_type))
+    if old.payments != new.payments:
+        changed.add(("payments", None))
+    return changed
+
+def _dump(value):
+    if is_dataclass(value):
+        return {item.name: _dump(getattr(value, item.name)) for item in fields(value)}
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _dump(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    return value
+
+def _load(cls, data):
+    return cls(**{item.name: Decimal(data[item.name]) if item.type is Decimal else data[item.name] for item in fields(cls)})
+
+def dump_parts(parts):
+    """Convert the parsed endpoints into JSON-serialisable data for storage."""
+    return {key: _dump(parts.get(key)) for key in PARSERS}
+
+def load_parts(data):
+    """Rebuild parsed endpoints from dump_parts output."""
+    parts = {}
+    if data.get("balance") is not None:
+        parts["balance"] = {supply_type: _load(BalanceSupply, item) for supply_type, item in data["balance"].items()}
+    if data.get("usage") is not None:
+        parts["usage"] = {
+            supply_id: (supply_type, _load(UsageSupply, item))
+            for supply_id, (supply_type, item) in data["usage"].items()
+        }
+    if data.get("user_data") is not None:
+        parts["user_data"] = UserData(
+            account=_load(Account, data["user_data"]["account"]),
+            tariff={supply_type: _load(TariffSupply, item) for supply_type, item in data["user_data"]["tariff"].items()},
+        )
+    return parts
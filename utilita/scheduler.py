@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_CONCURRENT_LOGINS = 1
+MAX_CONCURRENT_REQUESTS = 4
+# Portal requests allowed per budget period across every config entry.
+REQUEST_BUDGET = 120
+REQUEST_BUDGET_PERIOD = 600
+REFRESH_STAGGER = 2.0
+REFRESH_JITTER = 3.0
+
+
+class UtilitaScheduler:
+    """Shared by every Utilita config entry to spread refreshes and cap the load on the portal."""
+
+    def __init__(self) -> None:
+        self._login_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LOGINS)
+        self._request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._tokens = float(REQUEST_BUDGET)
+        self._tokens_updated = time.monotonic()
+        self._next_refresh = 0.0
+
+    async def async_wait_turn(self):
+        """Wait until this refresh may start, keeping refresh starts apart with jitter."""
+        now = time.monotonic()
+        start = max(now, self._next_refresh)
+        self._next_refresh = start + REFRESH_STAGGER + random.uniform(0, REFRESH_JITTER)
+        if start > now:
+            _LOGGER.debug(f"Delaying refresh by {start - now:.1f}s to stagger Utilita accounts")
+            await asyncio.sleep(start - now)
+
+    async def _async_take_token(self):
+        """Take one request from the global budget, waiting for it to refill if needed."""
+        rate = REQUEST_BUDGET / REQUEST_BUDGET_PERIOD
+        while True:
+            now = time.monotonic()
+            self._tokens = min(REQUEST_BUDGET, self._tokens + (now - self._tokens_updated) * rate)
+            self._tokens_updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            wait = (1 - self._tokens) / rate
+            _LOGGER.debug(f"Request budget exhausted, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def request(self):
+        """Hold a global request slot for one portal request."""
+        await self._async_take_token()
+        async with self._request_semaphore:
+            yield
+
+    @asynccontextmanager
+    async def login(self):
+        """Hold a global login slot for one login."""
+        async with self._login_semaphore:
+            yield
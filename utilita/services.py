@@ -0,0 +1,128 @@
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+import asyncio
+import logging
+import voluptuous as vol
+from itertools import chain
+from .api import ENDPOINTS
+from .const import DOMAIN
+from .export import EXPORT_DATA, EXPORT_FORMATS, ExportSummary, consume, iter_payments, iter_usage, write_export
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_START_DATE = "start_date"
+ATTR_END_DATE = "end_date"
+ATTR_PATH = "path"
+ATTR_FORMAT = "format"
+ATTR_DATA = "data"
+ATTR_ENDPOINTS = "endpoints"
+SERVICE_BACKFILL_USAGE = "backfill_usage"
+SERVICE_EXPORT_HISTORY = "export_history"
+SERVICE_REFRESH = "refresh"
+
+BACKFILL_USAGE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(ATTR_START_DATE): cv.date,
+        vol.Optional(ATTR_END_DATE): cv.date,
+    }
+)
+
+EXPORT_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(ATTR_START_DATE): cv.date,
+        vol.Optional(ATTR_END_DATE): cv.date,
+        vol.Optional(ATTR_PATH): cv.string,
+        vol.Optional(ATTR_FORMAT, default="csv"): vol.In(EXPORT_FORMATS),
+        vol.Optional(ATTR_DATA, default=list(EXPORT_DATA)): vol.All(cv.ensure_list, [vol.In(EXPORT_DATA)]),
+    }
+)
+
+REFRESH_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(ATTR_ENDPOINTS, default=list(ENDPOINTS)): vol.All(cv.ensure_list, [vol.In(ENDPOINTS)]),
+    }
+)
+
+
+def _coordinators(hass: HomeAssistant, call: ServiceCall):
+    """Return the coordinators a call targets: the given config entry, or every loaded one."""
+    entries = hass.data.get(DOMAIN, {})
+    entry_id = call.data.get(ATTR_CONFIG_ENTRY_ID)
+    if entry_id is not None:
+        if entry_id not in entries:
+            raise ServiceValidationError(f"Utilita config entry {entry_id} is not loaded")
+        return [entries[entry_id]["coordinator"]]
+    if not entries:
+        raise ServiceValidationError("No Utilita config entries are loaded")
+    return [data["coordinator"] for data in entries.values()]
+
+
+def _date_range(call: ServiceCall):
+    start = call.data.get(ATTR_START_DATE)
+    end = call.data.get(ATTR_END_DATE)
+    if start is not None and end is not None and start > end:
+        raise ServiceValidationError(f"{ATTR_START_DATE} must not be after {ATTR_END_DATE}")
+    return start, end
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the Utilita services, shared by every config entry."""
+
+    async def async_backfill_usage(call: ServiceCall) -> None:
+        start, end = _date_range(call)
+        for coordinator in _coordinators(hass, call):
+            if not coordinator.async_start_backfill(start, end):
+                _LOGGER.warning(f"A usage backfill is already running for entry {coordinator.entry.entry_id}")
+
+    async def async_export_history(call: ServiceCall) -> ServiceResponse:
+        start, end = _date_range(call)
+        coordinators = _coordinators(hass, call)
+        if len(coordinators) > 1:
+            raise ServiceValidationError(f"{ATTR_CONFIG_ENTRY_ID} is required when more than one account is loaded")
+        coordinator = coordinators[0]
+        path = call.data.get(ATTR_PATH)
+        if path is not None and not hass.config.is_allowed_path(path):
+            raise ServiceValidationError(f"Cannot write to {path}, add its directory to allowlist_external_dirs")
+
+        start = start.isoformat() if start else None
+        end = end.isoformat() if end else None
+        sources = []
+        if "usage" in call.data[ATTR_DATA]:
+            sources.append(iter_usage(coordinator.history, start, end))
+        if "payments" in call.data[ATTR_DATA]:
+            sources.append(iter_payments(coordinator.ledger, start, end))
+        # Records are generated, written and totalled one at a time in the executor.
+        summary = ExportSummary()
+        records = summary.track(chain.from_iterable(sources))
+        if path is None:
+            await hass.async_add_executor_job(consume, records)
+        else:
+            try:
+                await hass.async_add_executor_job(write_export, path, records, call.data[ATTR_FORMAT])
+            except OSError as err:
+                raise HomeAssistantError(f"Error exporting Utilita history to {path}: {err}") from err
+            _LOGGER.info(f"Exported {summary.records} Utilita records to {path}")
+        return {**summary.as_dict(), ATTR_PATH: path}
+
+    async def async_refresh(call: ServiceCall) -> None:
+        endpoints = set(call.data[ATTR_ENDPOINTS])
+        coordinators = _coordinators(hass, call)
+        await asyncio.gather(*(coordinator.async_refresh_endpoints(endpoints) for coordinator in coordinators))
+        failed = sorted({key for coordinator in coordinators for key in coordinator.stale_endpoints & endpoints})
+        if failed:
+            raise HomeAssistantError(f"Error refreshing Utilita {', '.join(failed)}")
+
+    hass.services.async_register(DOMAIN, SERVICE_BACKFILL_USAGE, async_backfill_usage, schema=BACKFILL_USAGE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_EXPORT_HISTORY,
+        async_export_history,
+        schema=EXPORT_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(DOMAIN, SERVICE_REFRESH, async_refresh, schema=REFRESH_SCHEMA)
@@ -0,0 +1,98 @@
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics, get_last_statistics
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+import asyncio
+import logging
+from datetime import datetime
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rows handed to the recorder per call, so a first-time backfill of years of
+# history is queued in small jobs instead of one long one.
+IMPORT_CHUNK_SIZE = 100
+
+SUPPLY_NAMES = {"elec": "Electricity", "gas": "Gas"}
+STATISTICS = (
+    ("consumption", "kwh", UnitOfEnergy.KILO_WATT_HOUR, 1),
+    ("cost", "pence", "GBP", 100),
+)
+
+
+class UsageStatistics:
+    """Import the stored daily usage history into recorder external statistics."""
+
+    def __init__(self, hass: HomeAssistant, history) -> None:
+        self.hass = hass
+        self._history = history
+        self._lock = asyncio.Lock()
+        # statistic_id -> (last imported date, running sum), so the database is
+        # only queried once per statistic and queued imports are not repeated.
+        self._imported = {}
+
+    async def async_import(self, since=None):
+        """Import every stored row newer than the last imported statistic.
+
+        since is the ISO date of the earliest row that was added or revised.
+        If it is not newer than the last import, the rows from that day on are
+        imported again, with the running sum recomputed from the stored rows
+        before it. The recorder replaces statistics that share a start time.
+        """
+        if "recorder" not in self.hass.config.components:
+            return
+        async with self._lock:
+            for supply_id, supply_type in self._history.supplies.items():
+                for kind, field, unit, divisor in STATISTICS:
+                    await self._async_import_statistic(supply_id, supply_type, kind, field, unit, divisor, since)
+
+    async def _async_last_imported(self, statistic_id):
+        if statistic_id in self._imported:
+            return self._imported[statistic_id]
+        last = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, statistic_id, True, {"sum"}
+        )
+        if not last.get(statistic_id):
+            return None, 0.0
+        row = last[statistic_id][0]
+        start = row["start"]
+        if not isinstance(start, datetime):
+            start = dt_util.utc_from_timestamp(start)
+        return dt_util.as_local(start).date().isoformat(), row["sum"] or 0.0
+
+    async def _async_import_statistic(self, supply_id, supply_type, kind, field, unit, divisor, since=None):
+        statistic_id = f"{DOMAIN}:{supply_type}_{supply_id}_{kind}".lower()
+        last_date, total = await self._async_last_imported(statistic_id)
+        rebuild = since is not None and last_date is not None and since <= last_date
+        if rebuild:
+            last_date, total = None, 0.0
+        statistics = []
+        for row in self._history.rows(supply_id):
+            day = row["date"][:10]
+            if (last_date is not None and day <= last_date) or row.get(field) is None:
+                continue
+            value = float(row[field]) / divisor
+            total += value
+            last_date = day
+            if rebuild and day < since:
+                # Already imported and unchanged; only its sum is needed.
+                continue
+            start = dt_util.start_of_local_day(dt_util.parse_date(day))
+            statistics.append(StatisticData(start=start, state=value, sum=total))
+        self._imported[statistic_id] = (last_date, total)
+        if not statistics:
+            return
+        metadata = StatisticMetaData(
+            has_mean=False,
+            has_sum=True,
+            name=f"Utilita {SUPPLY_NAMES.get(supply_type, supply_type)} {kind.title()} {supply_id}",
+            source=DOMAIN,
+            statistic_id=statistic_id,
+            unit_of_measurement=unit,
+        )
+        for index in range(0, len(statistics), IMPORT_CHUNK_SIZE):
+            async_add_external_statistics(self.hass, metadata, statistics[index:index + IMPORT_CHUNK_SIZE])
+            await asyncio.sleep(0)
+        _LOGGER.debug(f"Imported {len(statistics)} {kind} statistics for {statistic_id}")
@@ -0,0 +1,162 @@
+import logging
+import time
+from typing import NamedTuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# The same problem is logged again at most this often while it persists.
+PROBLEM_LOG_INTERVAL = 86400
+
+
+class SchemaProblem(NamedTuple):
+    """A field of a payload that is missing or not of the expected type."""
+
+    path: str
+    expected: str
+    found: str
+
+    def __str__(self):
+        return f"{self.path}: expected {self.expected}, got {self.found}"
+
+
+def _is_numeric_string(value):
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(value, str)
+
+
+# Values are (description, accepted types, fallback predicate); None accepts anything.
+ANY = ("any value", None, None)
+STRING = ("string", (str,), None)
+NUMBER = ("number", (int, float), _is_numeric_string)
+
+
+def _compile(spec, path):
+    """Turn a schema into a checker that adds a SchemaProblem to a set for every mismatch.
+
+    Dict keys ending in "?" are optional and may be null, a one-item list
+    checks every element against that item, and a value spec checks the type.
+    Paths are built here, once, and value checks are inlined into their
+    object's checker, so checking a row of usage costs no extra calls.
+    """
+    if isinstance(spec, dict):
+        fields = []
+        for key, item in spec.items():
+            name = key.rstrip("?")
+            item_path = f"{path}.{name}"
+            missing = SchemaProblem(item_path, "a value", "nothing")
+            if isinstance(item, tuple):
+                expected, types, fallback = item
+                fields.append((name, key.endswith("?"), missing, None, types, fallback, expected, item_path))
+            else:
+                fields.append((name, key.endswith("?"), missing, _compile(item, item_path), None, None, None, None))
+
+        def check_dict(value, problems):
+            if type(value) is not dict:
+                problems.add(SchemaProblem(path, "object", type(value).__name__))
+                return
+            for name, optional, missing, check, types, fallback, expected, item_path in fields:
+                item = value.get(name)
+                if item is None:
+                    if not optional:
+                        problems.add(missing)
+                elif check is not None:
+                    check(item, problems)
+                elif types is not None and type(item) not in types and (fallback is None or not fallback(item)):
+                    problems.add(SchemaProblem(item_path, expected, type(item).__name__))
+        return check_dict
+    if isinstance(spec, list):
+        check_item = _compile(spec[0], f"{path}[]")
+
+        def check_list(value, problems):
+            if type(value) is not list:
+                problems.add(SchemaProblem(path, "list", type(value).__name__))
+                return
+            for item in value:
+                check_item(item, problems)
+        return check_list
+    raise ValueError(f"Schema at {path} must be an object or a list")
+
+
+# The fields the parsers, usage history and payment ledger cannot do without,
+# and the types of the optional ones they convert.
+SCHEMAS = {
+    "balance": {
+        "data": {
+            "supplies": [{
+                "type": STRING,
+                "balance": {"money": NUMBER, "messages?": [{"text": STRING}]},
+                "emergency_credit": {},
+                "debt": {},
+            }],
+        },
+    },
+    "usage": {
+        "data": {
+            "data": [{
+                "type": STRING,
+                "supply_id": ANY,
+                "usage?": [{"date": STRING, "kwh": NUMBER, "pence?": NUMBER}],
+                "monthly_kwh": NUMBER,
+                "yearly_kwh": NUMBER,
+                "monthly_cost?": NUMBER,
+                "yearly_cost?": NUMBER,
+            }],
+        },
+    },
+    "user_data": {
+        "premises?": [{
+            "supplies?": [{
+                "type": STRING,
+                "tariff_description?": STRING,
+                "rate1?": NUMBER,
+                "rate2?": NUMBER,
+                "meter?": {},
+                "mpan?": {"top_line?": {}, "core?": {}},
+            }],
+        }],
+    },
+    "payments": {
+        "payments": [{
+            "type": ANY,
+            "metercreditamount": NUMBER,
+            "transactionamount": NUMBER,
+            "full_description": STRING,
+            "issuetime": STRING,
+        }],
+    },
+}
+VALIDATORS = {endpoint: _compile(schema, endpoint) for endpoint, schema in SCHEMAS.items()}
+
+
+def validate_payload(endpoint, payload):
+    """Return the problems found in a payload, sorted by path; endpoints without a schema always pass."""
+    validator = VALIDATORS.get(endpoint)
+    if validator is None:
+        return ()
+    problems = set()
+    validator(payload, problems)
+    return tuple(sorted(problems))
+
+
+class SchemaMonitor:
+    """The current payload problems of each endpoint, logged once per problem and interval."""
+
+    def __init__(self):
+        self.problems = {}
+        self._logged = {}
+
+    def record(self, endpoint, problems):
+        if not problems:
+            if self.problems.pop(endpoint, None):
+                _LOGGER.info(f"The {endpoint} payload matches the expected format again")
+            return
+        self.problems[endpoint] = problems
+        now = time.monotonic()
+        for problem in problems:
+            key = (endpoint, problem)
+            if now - self._logged.get(key, -PROBLEM_LOG_INTERVAL) >= PROBLEM_LOG_INTERVAL:
+                self._logged[key] = now
+                _LOGGER.warning(f"Unexpected {endpoint} payload from the Utilita portal: {problem}")